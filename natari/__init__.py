@@ -2,7 +2,14 @@
 __version__ = "0.2.7"
 
 
+def __getattr__(name):
+    # The plugin hook is imported when napari asks for it. Hence, the game engines can be imported without
+    # napari and the games themselves are imported only when they are launched.
+    if name == "napari_experimental_provide_function":
+        from ._function import napari_experimental_provide_function
+        return napari_experimental_provide_function
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
 
 
-
-from ._function import napari_experimental_provide_function
+def __dir__():
+    return sorted(list(globals().keys()) + ["napari_experimental_provide_function"])
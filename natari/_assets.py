@@ -0,0 +1,114 @@
+import hashlib
+import os
+import sys
+from pathlib import Path
+from types import ModuleType
+
+import numpy as np
+
+# increase when the decoding changes, so that old cache files are not used anymore
+CACHE_VERSION = 1
+
+
+def data_path(name):
+    """
+    Path of a file bundled with natari, e.g. data_path("IXMtest_A02_s9.tif").
+    """
+    return Path(__file__).parent / "data" / name
+
+
+def cache_dir():
+    """
+    Folder where decoded images are cached. Can be configured using the NATARI_CACHE_DIR environment variable.
+    """
+    if "NATARI_CACHE_DIR" in os.environ:
+        return Path(os.environ["NATARI_CACHE_DIR"])
+    if sys.platform == "win32" and "LOCALAPPDATA" in os.environ:
+        return Path(os.environ["LOCALAPPDATA"]) / "natari" / "cache"
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Caches" / "natari"
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "natari"
+
+
+def load_image(path, reader=None, cache_key=None):
+    """
+    Load an image file. At the first call, the file is decoded and saved as .npy file in the `cache_dir()`. Later
+    calls memory-map the cached array, which is read-only. Copy it before modifying it.
+
+    The cache file is renewed when the image file's modification time or size change.
+
+    Parameters
+    ----------
+    path: str or Path
+        image file, e.g. `data_path("IXMtest_A02_s9.tif")`
+    reader: callable, optional
+        function decoding the file, defaults to tifffile for .tif files and scikit-image for others. Readers are
+        told apart in the cache by their module and qualified name. Files decoded by readers without a stable name,
+        e.g. lambdas, `functools.partial` objects or functions defined inside functions, are not cached unless a
+        `cache_key` is given.
+    cache_key: str, optional
+        name of the reader and its settings in the cache, e.g. "my_reader(channel=1)"
+
+    Returns
+    -------
+        numpy array, memory-mapped if the cache folder is writable
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+    # files decoded by different readers are cached separately
+    reader_key = "key:" + str(cache_key) if cache_key is not None else _reader_name(reader)
+    if reader_key is None:
+        return np.asarray(_read(path, reader))
+    path_key = _hash(str(path) + "|" + reader_key)
+    version_key = _hash("|".join([str(CACHE_VERSION), str(stat.st_mtime_ns), str(stat.st_size)]))
+    cache_file = cache_dir() / (path.stem + "-" + path_key + "-" + version_key + ".npy")
+
+    try:
+        return np.load(cache_file, mmap_mode='r')
+    except (OSError, ValueError):
+        pass  # not cached yet or broken
+
+    data = np.asarray(_read(path, reader))
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+
+        # remove outdated versions of the same file
+        for outdated in cache_file.parent.glob(path.stem + "-" + path_key + "-*.npy"):
+            outdated.unlink()
+
+        # write to a temporary file first, so that no other process maps a half-written file
+        temp_file = cache_file.with_name(cache_file.name + "." + str(os.getpid()) + ".tmp")
+        with open(temp_file, "wb") as file:
+            np.save(file, data, allow_pickle=False)
+        os.replace(temp_file, cache_file)
+        return np.load(cache_file, mmap_mode='r')
+    except (OSError, ValueError):
+        return data  # cache not writable, work with the decoded image
+
+
+def _read(path, reader=None):
+    if reader is not None:
+        return reader(path)
+    if path.suffix.lower() in [".tif", ".tiff"]:
+        from tifffile import imread
+    else:
+        from skimage.io import imread
+    return imread(path)
+
+
+def _reader_name(reader):
+    # module and qualified name of a function, or None if they don't tell it apart from other readers, e.g. the
+    # same method of two objects
+    if reader is None:
+        return "default"
+    if not isinstance(getattr(reader, "__self__", None), (type(None), ModuleType)):
+        return None
+    module = getattr(reader, "__module__", None)
+    qualname = getattr(reader, "__qualname__", None)
+    if not isinstance(module, str) or not isinstance(qualname, str) or "<" in qualname:
+        return None
+    return module + "." + qualname
+
+
+def _hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
@@ -0,0 +1,255 @@
+"""
+Computer players. A bot looks at the game state and sends the same input a human player would, e.g.
+`game.set_direction(2, -1, 0)`. Bots are called in the game thread right before every game step, see
+`GameSession.add_bot()`, and stay within a time budget per step.
+"""
+import time
+
+import numpy as np
+
+
+class Bot:
+    """
+    Base class of all bots. `act()` measures how long `decide()` takes.
+
+    Parameters
+    ----------
+    game:
+        the game to play
+    player: int
+        the player the bot steers, counting from 1
+    budget: float
+        seconds the bot may think per step. Searches stop when the budget is used up.
+    stop_at_budget: bool
+        if False, the budget is only measured. Searches are then limited by the number of steps they take only,
+        which makes games repeatable, e.g. in `natari._tournament`.
+    seed: int, optional
+        seed for bots which make random mistakes
+    """
+    def __init__(self, game, player=1, budget=0.002, stop_at_budget=True, seed=None):
+        self.game = game
+        self.player = player
+        self.budget = budget
+        self.stop_at_budget = stop_at_budget
+        self.random = np.random.default_rng(seed)
+
+        self.ticks = 0
+        self.total_time = 0
+        self.max_time = 0
+        self.overruns = 0
+
+    def act(self):
+        start = time.perf_counter()
+        self.deadline = start + self.budget
+        self.decide()
+        duration = time.perf_counter() - start
+
+        self.ticks += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+        if duration > self.budget:
+            self.overruns += 1
+
+    def decide(self):
+        raise NotImplementedError()
+
+    def out_of_time(self):
+        return self.stop_at_budget and time.perf_counter() > self.deadline
+
+    def stats(self):
+        """
+        Returns the time the bot took per step
+        """
+        ticks = max(self.ticks, 1)
+        return {
+            "ticks": self.ticks,
+            "mean_time_ms": self.total_time / ticks * 1000,
+            "max_time_ms": self.max_time * 1000,
+            "overruns": self.overruns,
+        }
+
+
+class SnakeBot(Bot):
+    """
+    Steers a snake to the nearest food along the shortest free path, found by growing a wavefront from all food.
+    Moves into areas which are too small for the snake and next to other snakes' heads are avoided. The bot only
+    looks at the cells up to `view` cells around the head, food further away is approached directly. Thus, the
+    time the bot needs doesn't depend on the size of the playground.
+    """
+    # (row, column) steps, as passed to `set_direction()`
+    moves = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+    def __init__(self, game, player=1, budget=0.002, stop_at_budget=True, seed=None, view=20):
+        super().__init__(game, player, budget, stop_at_budget, seed)
+        self.view = view
+
+    def decide(self):
+        from scipy.ndimage import label
+
+        game = self.game
+        if game.game_over_countdown > 0 or not game.alive[self.player - 1]:
+            return
+
+        # the cells around the head; the wall around the playground isn't free
+        grid = game._grid()
+        head_x, head_y = game.positions(self.player)[0] // game.pixel_size
+        top, left = max(head_y - self.view, 0), max(head_x - self.view, 0)
+        window = grid.window(top, left, head_y + self.view + 1, head_x + self.view + 1)
+        free = window <= 0
+        free[:, 0] &= left > 0
+        free[0, :] &= top > 0
+        free[:, -1] &= left + window.shape[1] < grid.shape[1]
+        free[-1, :] &= top + window.shape[0] < grid.shape[0]
+
+        # the game's directions are (x, y) steps
+        direction_x, direction_y = np.sign(game.directions[self.player - 1])
+        current = (int(direction_y), int(direction_x))
+
+        # the possible next cells, no reversal into the own body
+        options = {}
+        for move in self.moves:
+            row, column = head_y - top + move[0], head_x - left + move[1]
+            if move != (-current[0], -current[1]) and 0 <= row < free.shape[0] and 0 <= column < free.shape[1] \
+                    and free[row, column]:
+                options[move] = (row, column)
+        if len(options) == 0:
+            return  # nowhere to go
+
+        # the space behind every move
+        regions, _ = label(free)
+        sizes = np.bincount(regions.ravel())
+        space = {move: sizes[regions[cell]] for move, cell in options.items()}
+
+        # cells other snakes' heads may move to
+        others = np.nonzero(game.alive)[0]
+        others = others[others != self.player - 1]
+        heads = game.bodies[others, game.head_index] // game.pixel_size - [left, top]
+        contested = set()
+        for x, y in heads.tolist():
+            contested.update([(y - 1, x), (y + 1, x), (y, x - 1), (y, x + 1)])
+
+        length = int(game.lengths[self.player - 1])
+        safe = [move for move, cell in options.items()
+                if space[move] >= min(length, sizes[1:].max()) and cell not in contested]
+
+        # go for food, as long as there is enough space behind it
+        food = window < 0
+        move = None
+        if np.isin([regions[cell] for cell in options.values()], regions[food]).any():
+            move = self._search_food(free, food, options)
+        if move is None:
+            move = self._towards_food(head_x, head_y, current)
+        if move not in safe:
+            if current in safe:
+                move = current
+            elif len(safe) > 0:
+                move = safe[0]
+            else:
+                move = max(space, key=space.get)
+
+        if move != current:
+            game.set_direction(self.player, *move)
+
+    def _search_food(self, free, food, options):
+        """
+        Grow a wavefront from all food through the free cells until it reaches one of the next cells. Returns the
+        move to this cell, which is on a shortest path to food, or None if no food can be reached.
+        """
+        # flat arrays with a border which isn't free, so that moving by +-1 doesn't wrap around to the next row
+        width = free.shape[1] + 2
+        free = np.pad(free, 1).ravel()
+        front = np.pad(food, 1).ravel() & free
+        moves = list(options.keys())
+        targets = [(row + 1) * width + column + 1 for row, column in options.values()]
+
+        reached = front.copy()
+        while front.any() and not self.out_of_time():
+            hit = front[targets]
+            if hit.any():
+                return moves[int(np.argmax(hit))]
+            grown = np.zeros(front.shape, dtype=bool)
+            grown[width:] |= front[:-width]
+            grown[:-width] |= front[width:]
+            grown[1:] |= front[:-1]
+            grown[:-1] |= front[1:]
+            front = grown & free & ~reached
+            reached |= front
+        return None
+
+    def _towards_food(self, head_x, head_y, current):
+        """
+        The move towards the nearest food in a straight line, for food out of view
+        """
+        game = self.game
+        if len(game.food_positions) == 0:
+            return current
+        delta = game.food_positions // game.pixel_size - [head_x, head_y]
+        delta_x, delta_y = delta[np.argmin(np.abs(delta).sum(axis=1))]
+        if abs(delta_x) > abs(delta_y):
+            return 0, int(np.sign(delta_x))
+        return int(np.sign(delta_y)), 0
+
+
+class PingPongBot(Bot):
+    """
+    Predicts where the puck will cross the bar's line, including bounces at the top and bottom, and moves the bar
+    there. While the puck moves away, the bar returns to the center. Like humans, the bot misses its target by up
+    to `error` pixels, otherwise it would never lose.
+    """
+    def __init__(self, game, player=1, budget=0.002, stop_at_budget=True, seed=None, error=60):
+        super().__init__(game, player, budget, stop_at_budget, seed)
+        self.error = error
+        self.miss = 0
+        self.approaching = False
+
+    def decide(self):
+        game = self.game
+        if self.player == 1:
+            bar_x, position, approaching = game.player1_x, game.player1_position, game.puck_velocity_x < 0
+        else:
+            bar_x, position, approaching = game.player2_x, game.player2_position, game.puck_velocity_x > 0
+
+        if approaching and not self.approaching:
+            # a new mistake for every return
+            self.miss = self.random.uniform(-self.error, self.error)
+        self.approaching = approaching
+
+        target = game.height / 2
+        if approaching:
+            # unfold the bounces: the puck moves in a strip of twice the height
+            time_to_bar = (bar_x - game.puck_x) / game.puck_velocity_x
+            y = (game.puck_y + game.puck_velocity_y * time_to_bar) % (2 * game.height)
+            target = (y if y <= game.height else 2 * game.height - y) + self.miss
+
+        if abs(target - position) > 5:
+            game.move_player(self.player, 10 if target > position else -10)
+
+
+class ArcadeBot(Bot):
+    """
+    Picks the nucleus closest to the player, considering how far the field of view scrolls while a bullet flies,
+    moves below it and fires.
+    """
+    def __init__(self, game, player=1, budget=0.002, stop_at_budget=True, seed=None, max_bullets=5):
+        super().__init__(game, player, budget, stop_at_budget, seed)
+        self.max_bullets = max_bullets
+
+    def decide(self):
+        game = self.game
+        height, width = game.size[0], game.size[1]
+        fov = np.asarray(game.nuclei)[:height, game.fov_x:game.fov_x + width] > 0
+        columns = np.nonzero(fov.any(axis=0))[0]
+        if len(columns) == 0:
+            return
+
+        # a bullet flies 10 pixels per step from the bottom to the lowest nucleus pixel in the column
+        lowest = height - 1 - np.argmax(fov[::-1, columns], axis=0)
+        steps = (height - lowest) / 10
+        aims = columns - game.fov_delta_x * steps
+        aim = aims[np.argmin(np.abs(aims - game.player_position))]
+
+        if abs(aim - game.player_position) <= 5:
+            if len(game.bullets) < self.max_bullets:
+                game.fire()
+        else:
+            game.move_player(10 if aim > game.player_position else -10)
@@ -4,28 +4,44 @@ This module is an example of a barebones function plugin for napari
 It implements the ``napari_experimental_provide_function`` hook specification.
 see: https://napari.org/docs/dev/plugins/hook_specifications.html
 
-Replace code below according to your needs.
+The functions registered here are light-weight shims: the game modules and their dependencies
+(scipy, tifffile, scikit-image, ...) are only imported when a game is launched. Thus, napari
+doesn't pay for loading natari at startup.
 """
-from typing import TYPE_CHECKING
-
-from enum import Enum
-import numpy as np
+import napari
 from napari_plugin_engine import napari_hook_implementation
-from .cell_counting_arcade import cell_counting_arcade_with_default_image
-from .ping_pong import ping_pong
-from .snake import snake
-from .sliding_puzzle import sliding_puzzle
+from napari_tools_menu import register_action
+
+
+@register_action(menu="Games > Cell counting arcade")
+def cell_counting_arcade_with_default_image(viewer : napari.Viewer):
+    from .cell_counting_arcade import cell_counting_arcade_with_default_image
+    return cell_counting_arcade_with_default_image(viewer)
+
+
+@register_action(menu="Games > Ping pong")
+def ping_pong(viewer : napari.Viewer):
+    from .ping_pong import ping_pong
+    return ping_pong(viewer)
 
-if TYPE_CHECKING:
-    import napari
+
+@register_action(menu="Games > Snake")
+def snake(viewer : napari.Viewer):
+    from .snake import snake
+    return snake(viewer)
+
+
+@register_action(menu="Games > Sliding Puzzle")
+def sliding_puzzle(viewer: napari.Viewer):
+    from .sliding_puzzle import sliding_puzzle
+    return sliding_puzzle(viewer)
 
 
 # This is the actual plugin function, where we export our function
-# (The functions themselves are defined below)
+# (The functions themselves are defined above)
 @napari_hook_implementation
 def napari_experimental_provide_function():
     # we can return a single function
     # or a tuple of (function, magicgui_options)
     # or a list of multiple functions with or without options, as shown here:
     return [cell_counting_arcade_with_default_image, ping_pong, snake, sliding_puzzle]
-
@@ -0,0 +1,39 @@
+import threading
+import time
+from collections import deque, namedtuple
+
+InputEvent = namedtuple("InputEvent", ["timestamp", "action", "args"])
+
+
+class InputQueue:
+    """
+    Collects key presses from the GUI thread so that the game thread can apply them at the start of a tick.
+
+    Key handlers only call `put()`, they never touch the game state. Putting an event also sets the `wake` event,
+    usually the one of the `Scheduler`, so that input is applied before the game's next frame is due. If nobody
+    drains the queue, e.g. because the game is paused, only the latest `maxlen` events are kept.
+    """
+    def __init__(self, wake: threading.Event = None, maxlen: int = 256):
+        self._events = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self.wake = wake if wake is not None else threading.Event()
+
+    def put(self, action, *args):
+        """
+        Add an action, e.g. `put("direction", 0, 1, -1)`. Called from the GUI thread.
+        """
+        with self._lock:
+            self._events.append(InputEvent(time.perf_counter(), action, args))
+        self.wake.set()
+
+    def drain(self):
+        """
+        Remove and return all pending events in the order they arrived.
+        """
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+    def pending(self):
+        return len(self._events) > 0
@@ -0,0 +1,398 @@
+"""
+Network play: one process hosts a game, players join from other processes or computers.
+
+The host runs the game steps. Clients send their key hits and receive the game state after every step.
+Only values which changed since the last step are sent, and lists which were shifted, like the positions of a
+moving snake, are sent as the new elements only. Messages are newline-separated JSON over TCP or UNIX sockets.
+
+Example, all on localhost:
+
+    >>> from natari.snake import Game
+    >>> from natari._network import measure
+    >>> stats = measure(Game(render_mode="vector"), ticks=100)
+"""
+import asyncio
+import json
+import threading
+import time
+
+
+class GameHost:
+    """
+    Runs a game and sends its state to all connected clients after every step. The first clients control
+    player 1, 2, ..., further clients watch.
+
+    The game needs a `frame_delay` in seconds and the methods `game_step()`, `state()` and
+    `remote_input(player, action, args)`.
+
+    Clients which don't read fast enough are skipped while more than `max_buffer` bytes wait for being sent to
+    them. They receive the changes of all skipped steps in one message later, thus the host's memory stays bounded.
+    """
+    def __init__(self, game, max_players=2, max_buffer=2 ** 20):
+        self.game = game
+        self.max_players = max_players
+        self.max_buffer = max_buffer
+        self.tick = 0
+        self.clients = []
+        self.server = None
+        self._handlers = []
+        self.bytes_sent = 0
+        self.skipped = 0
+        self.step_time = 0
+
+    async def serve(self, host="127.0.0.1", port=0, path=None):
+        """
+        Start accepting clients on a TCP port or, if a `path` is given, on a UNIX socket.
+
+        Returns
+        -------
+            the address clients can connect to, (host, port) or path
+        """
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self._handle_client, path=path)
+            return path
+        self.server = await asyncio.start_server(self._handle_client, host=host, port=port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def run(self, ticks=None):
+        """
+        Forward the game every `frame_delay` seconds and send the new state to the clients, forever or for a given
+        number of ticks.
+        """
+        next_tick = time.perf_counter()
+        while ticks is None or self.tick < ticks:
+            start = time.perf_counter()
+            self.game.game_step()
+            state = _snapshot(self.game.state())
+            self.step_time += time.perf_counter() - start
+            self.tick += 1
+
+            for client in list(self.clients):
+                if client.writer.transport.get_write_buffer_size() > self.max_buffer:
+                    # the client is behind, the next delta contains this step's changes, too
+                    self.skipped += 1
+                    continue
+                delta = diff_state(client.last_state, state)
+                message = {"tick": self.tick, "delta": delta}
+                if client.ack is not None:
+                    message["ack"] = client.ack
+                    client.ack = None
+                client.last_state = state
+                self._send(client, message)
+
+            next_tick = max(next_tick + self.game.frame_delay, time.perf_counter())
+            await asyncio.sleep(next_tick - time.perf_counter())
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+        for client in list(self.clients):
+            client.writer.close()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+
+    def stats(self):
+        """
+        Returns the bytes sent to all clients, the number of messages skipped for slow clients and the step time,
+        averaged over all ticks so far.
+        """
+        ticks = max(self.tick, 1)
+        return {
+            "ticks": self.tick,
+            "clients": len(self.clients),
+            "bytes_sent": self.bytes_sent,
+            "bytes_per_tick": self.bytes_sent / ticks,
+            "skipped": self.skipped,
+            "step_time_ms": self.step_time / ticks * 1000,
+        }
+
+    async def _handle_client(self, reader, writer):
+        taken = [client.player for client in self.clients]
+        player = next((p for p in range(1, self.max_players + 1) if p not in taken), None)
+        client = _Connection(writer, player)
+        self.clients.append(client)
+        self._handlers.append(asyncio.current_task())
+        self._send(client, {"player": player, "frame_delay": self.game.frame_delay})
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    action, args = message["action"], list(message.get("args", []))
+                except (ValueError, KeyError, TypeError):
+                    continue  # ignore garbage
+                if client.player is not None:
+                    try:
+                        self.game.remote_input(client.player, action, args)
+                    except (TypeError, ValueError, LookupError):
+                        pass  # input the game can't handle is ignored like garbage, the client stays
+                if "sent" in message:
+                    client.ack = message["sent"]
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.remove(client)
+            writer.close()
+
+    def _send(self, client, message):
+        data = (json.dumps(message, separators=(",", ":")) + "\n").encode("utf-8")
+        self.bytes_sent += len(data)
+        client.writer.write(data)
+
+
+class _Connection:
+    def __init__(self, writer, player):
+        self.writer = writer
+        self.player = player
+        self.last_state = None
+        self.ack = None
+
+
+class GameClient:
+    """
+    Connects to a `GameHost`, sends input and keeps the last two states received, for interpolating between them.
+    """
+    def __init__(self):
+        self.player = None
+        self.frame_delay = None
+        self.state = None
+        self.tick = 0
+        self._previous = None  # (arrival time, state)
+        self._current = None
+        self._loop = None
+        self._writer = None
+        self.connected = threading.Event()
+
+        self.bytes_received = 0
+        self.messages = 0
+        self.round_trip_times = []
+
+    async def connect(self, host="127.0.0.1", port=None, path=None):
+        if path is not None:
+            reader, self._writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, self._writer = await asyncio.open_connection(host, port)
+        self._loop = asyncio.get_running_loop()
+
+        line = await reader.readline()
+        self.bytes_received += len(line)
+        welcome = json.loads(line)
+        self.player = welcome["player"]
+        self.frame_delay = welcome["frame_delay"]
+        self.connected.set()
+        return reader
+
+    async def receive(self, reader):
+        """
+        Receive states until the host closes the connection.
+        """
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            now = time.perf_counter()
+            self.bytes_received += len(line)
+            self.messages += 1
+
+            message = json.loads(line)
+            self.state = apply_delta(self.state, message["delta"])
+            self.tick = message["tick"]
+            self._previous, self._current = self._current, (now, self.state)
+            if "ack" in message:
+                self.round_trip_times.append(now - message["ack"])
+
+    def send(self, action, *args):
+        """
+        Send input to the host. Can be called from any thread.
+        """
+        message = {"action": action, "args": list(args), "sent": time.perf_counter()}
+        data = (json.dumps(message, separators=(",", ":")) + "\n").encode("utf-8")
+        self._loop.call_soon_threadsafe(self._writer.write, data)
+
+    def interpolated(self, now=None):
+        """
+        Returns the last state received, with floats interpolated between the last two states. Thus, the game
+        is shown up to one step behind the host but moves smoothly when rendered more often than the host steps.
+        Integers, e.g. scores or positions on a grid, are not interpolated.
+        """
+        if self._current is None:
+            return None
+        if self._previous is None:
+            return self._current[1]
+        if now is None:
+            now = time.perf_counter()
+
+        arrival, current = self._current
+        _, previous = self._previous
+        alpha = min(max((now - arrival) / self.frame_delay, 0), 1)
+        result = dict(current)
+        for key, value in current.items():
+            before = previous.get(key)
+            if isinstance(value, float) and isinstance(before, float):
+                result[key] = before + (value - before) * alpha
+        return result
+
+    def close(self):
+        if self._writer is not None:
+            self._loop.call_soon_threadsafe(self._writer.close)
+
+    def stats(self):
+        """
+        Returns bandwidth and round-trip time of input to the next state message.
+        """
+        messages = max(self.messages, 1)
+        round_trip_times = self.round_trip_times if len(self.round_trip_times) > 0 else [0]
+        return {
+            "ticks": self.tick,
+            "bytes_received": self.bytes_received,
+            "bytes_per_tick": self.bytes_received / messages,
+            "round_trip_ms": sum(round_trip_times) / len(round_trip_times) * 1000,
+            "max_round_trip_ms": max(round_trip_times) * 1000,
+        }
+
+    def start(self, host="127.0.0.1", port=None, path=None, timeout=5):
+        """
+        Connect and receive states in a background thread, e.g. for showing the game in napari.
+        """
+        async def run():
+            reader = await self.connect(host, port, path)
+            await self.receive(reader)
+
+        threading.Thread(target=asyncio.run, args=(run(),), daemon=True).start()
+        if not self.connected.wait(timeout):
+            raise ConnectionError("Could not connect to natari host")
+        return self
+
+
+class RemoteGame:
+    """
+    A game hosted elsewhere, which can be shown in napari like a local game, e.g.
+    `start_snake(viewer, game=RemoteGame(Game(), GameClient().start(port=...)))`.
+
+    The local game only renders the states received from the host. Its key hits are sent to the host, which
+    applies them to the player this client controls.
+    """
+    def __init__(self, game, client, frame_delay=1 / 60):
+        self.game = game
+        self.client = client
+        self.frame_delay = frame_delay
+
+    def __getattr__(self, name):
+        return getattr(self.game, name)
+
+    @property
+    def viewport(self):
+        return self.game.viewport
+
+    @viewport.setter
+    def viewport(self, viewport):
+        # the part of the playground to render is decided locally
+        self.game.viewport = viewport
+
+    def handle_inputs(self):
+        for event in self.game.inputs.drain():
+            # the host knows which player we are
+            self.client.send(event.action, *event.args[1:])
+        return False
+
+    def game_step(self):
+        self.handle_inputs()
+        state = self.client.interpolated()
+        if state is not None:
+            self.game.load_state(state)
+        return self.game.render()
+
+    def render(self):
+        return self.game.render()
+
+    def reset(self):
+        pass  # the host decides when a game starts
+
+
+def diff_state(old, new):
+    """
+    Returns the entries of the state `new` which differ from `old`. Lists which were shifted by a few elements
+    are encoded as {"prepend": [new elements], "length": new length}.
+    """
+    delta = {}
+    for key, value in new.items():
+        before = old.get(key) if old is not None else None
+        if before == value and old is not None and key in old:
+            continue
+        if isinstance(value, list) and isinstance(before, list):
+            shift = _shift(before, value)
+            if shift is not None:
+                delta[key] = {"prepend": value[:shift], "length": len(value)}
+                continue
+        delta[key] = value
+    return delta
+
+
+def apply_delta(state, delta):
+    """
+    Returns a new state with a delta computed by `diff_state()` applied.
+    """
+    state = dict(state) if state is not None else {}
+    for key, value in delta.items():
+        if isinstance(value, dict) and "prepend" in value:
+            state[key] = (value["prepend"] + state[key])[:value["length"]]
+        else:
+            state[key] = value
+    return state
+
+
+def _shift(before, after, max_shift=3):
+    """
+    Returns how many elements were put in front of `before` to get `after`, cutting its end, or None.
+    """
+    for shift in range(0, min(max_shift, len(after)) + 1):
+        if after[shift:] == before[:len(after) - shift]:
+            return shift
+    return None
+
+
+def _snapshot(state):
+    # a copy of the state as it will be sent, so that changes of the game don't affect it
+    return json.loads(json.dumps(state))
+
+
+def measure(game, ticks=100, players=2, frame_delay=None, path=None):
+    """
+    Host a game on localhost and connect scripted clients, which turn or move randomly. Useful for testing.
+
+    Returns
+    -------
+        dictionary with the host's and the clients' statistics
+    """
+    import random
+
+    if frame_delay is not None:
+        game.frame_delay = frame_delay
+
+    async def play(client, reader, host):
+        receiving = asyncio.ensure_future(client.receive(reader))
+        actions = {"direction": [(0, 1), (1, 0), (0, -1), (-1, 0)], "move": [(-10,), (10,)]}
+        action = "direction" if hasattr(game, "set_player1_direction") else "move"
+        while host.tick < ticks:
+            client.send(action, *random.choice(actions[action]))
+            await asyncio.sleep(game.frame_delay * 2)
+        receiving.cancel()
+
+    async def main():
+        host = GameHost(game, max_players=players)
+        address = await host.serve(path=path)
+        clients = [GameClient() for _ in range(players)]
+        readers = []
+        for client in clients:
+            if path is not None:
+                readers.append(await client.connect(path=path))
+            else:
+                readers.append(await client.connect(*address))
+
+        await asyncio.gather(host.run(ticks), *[play(c, r, host) for c, r in zip(clients, readers)])
+        await host.close()
+        return {"host": host.stats(), "clients": [client.stats() for client in clients]}
+
+    return asyncio.run(main())
@@ -0,0 +1,222 @@
+"""
+Recording games to GIF, MP4 or NPZ files while they are played.
+
+Frames are handed over from the game thread to a writer thread through a bounded queue. If the writer falls
+behind, frames are dropped and counted instead of slowing down the game. Frames are encoded one by one, so memory
+use doesn't grow with the length of the recording.
+"""
+import queue
+import threading
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+
+class Recorder:
+    """
+    Writes frames to a file in a background thread.
+
+    The file format is chosen by the file ending: .gif and .mp4 need `imageio` (and `imageio-ffmpeg` for .mp4),
+    .npz is written with numpy only. NPZ recordings are stored in chunks of a key frame and the bitwise
+    differences (XOR) between subsequent frames, which are mostly zero and compress well, see `load_recording()`.
+
+    Parameters
+    ----------
+    path: str or Path
+    fps: float
+        frames per second of GIF and MP4 files, e.g. 1 / frame_delay of the game
+    contrast_limits: tuple
+        intensities shown black and white (or the colormap's ends) in GIF and MP4 files
+    colormap: str, optional
+        name of a napari colormap for GIF and MP4 files, e.g. "turbo". Default: gray
+    max_queue: int
+        number of frames which can wait for being written before frames are dropped
+    chunk_size: int
+        number of frames per chunk in NPZ files
+
+    Raises
+    ------
+    ValueError
+        for other file endings
+    ImportError
+        if imageio is missing for .gif and .mp4 files
+    """
+    def __init__(self, path, fps=20, contrast_limits=(0, 1), colormap=None, max_queue=64, chunk_size=100):
+        self.path = Path(path)
+        self.fps = fps
+        self.contrast_limits = contrast_limits
+        self.colormap = colormap
+        self.chunk_size = chunk_size
+
+        # fail here instead of in the writer thread
+        suffix = self.path.suffix.lower()
+        if suffix in [".gif", ".mp4"]:
+            import imageio
+        elif suffix != ".npz":
+            raise ValueError("Cannot record to " + suffix + " files. Use .gif, .mp4 or .npz")
+
+        self.written = 0
+        self.dropped = 0
+        self.error = None
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def push(self, frame):
+        """
+        Hand over a frame for writing. Never blocks: if the writer is behind, the frame is dropped. Missing
+        frames (None) are counted as dropped, too.
+        """
+        if frame is None:
+            self.dropped += 1
+            return
+        try:
+            # copy, because games draw the next frame into the same array
+            self._queue.put_nowait(np.array(frame, copy=True))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """
+        Write the remaining frames and close the file.
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        suffix = self.path.suffix.lower()
+        try:
+            if suffix == ".npz":
+                writer = _NpzWriter(self.path, self.chunk_size)
+            else:
+                writer = _VideoWriter(self.path, self.fps, self.contrast_limits, self.colormap)
+        except Exception as e:
+            self.error = e
+            writer = None
+
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                break
+            if writer is None:
+                self.dropped += 1
+                continue
+            try:
+                writer.append(frame)
+                self.written += 1
+            except Exception as e:
+                self.error = e
+                writer = None
+
+        if writer is not None:
+            writer.close()
+
+
+class _VideoWriter:
+    def __init__(self, path, fps, contrast_limits, colormap):
+        import imageio
+
+        if path.suffix.lower() == ".gif":
+            self._writer = imageio.get_writer(path, mode="I", duration=_gif_duration(fps), loop=0)
+        else:
+            self._writer = imageio.get_writer(path, fps=fps, macro_block_size=1)
+        self.contrast_limits = contrast_limits
+        self._lut = _lookup_table(colormap)
+
+        # uint8 frames are colored by looking up all 256 values at once
+        low, high = contrast_limits
+        values = np.arange(256)
+        self._uint8_lut = self._lut[np.clip((values - low) * (255 / (high - low)), 0, 255).astype(np.uint8)]
+
+    def append(self, frame):
+        if frame.dtype == np.uint8:
+            self._writer.append_data(self._uint8_lut[frame])
+            return
+        low, high = self.contrast_limits
+        index = np.clip((np.asarray(frame, dtype=float) - low) * (255 / (high - low)), 0, 255).astype(np.uint8)
+        self._writer.append_data(self._lut[index])
+
+    def close(self):
+        self._writer.close()
+
+
+class _NpzWriter:
+    def __init__(self, path, chunk_size):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.chunk = []
+        self.chunk_index = 0
+        if path.exists():
+            path.unlink()
+
+    def append(self, frame):
+        if len(self.chunk) > 0 and (frame.shape != self.chunk[0].shape or frame.dtype != self.chunk[0].dtype):
+            self._write_chunk()
+        self.chunk.append(frame)
+        if len(self.chunk) >= self.chunk_size:
+            self._write_chunk()
+
+    def _write_chunk(self):
+        if len(self.chunk) == 0:
+            return
+        frames = _as_bits(np.asarray(self.chunk))
+        delta = np.bitwise_xor(frames[1:], frames[:-1])
+        name = "chunk" + str(self.chunk_index).zfill(6)
+        with zipfile.ZipFile(self.path, mode="a", compression=zipfile.ZIP_DEFLATED) as archive:
+            for key, array in [(name + "_key", self.chunk[0]), (name + "_delta", delta)]:
+                with archive.open(key + ".npy", mode="w", force_zip64=True) as file:
+                    np.lib.format.write_array(file, np.asarray(array), allow_pickle=False)
+        self.chunk = []
+        self.chunk_index += 1
+
+    def close(self):
+        self._write_chunk()
+
+
+def load_recording(path):
+    """
+    Iterate over the frames of an NPZ recording made by `Recorder`.
+    """
+    with np.load(path) as archive:
+        keys = sorted(key[:-len("_key")] for key in archive.files if key.endswith("_key"))
+        for name in keys:
+            frame = archive[name + "_key"]
+            yield frame
+            current = _as_bits(frame)
+            for delta in archive[name + "_delta"]:
+                current = np.bitwise_xor(current, delta)
+                yield current.view(frame.dtype)
+
+
+def _gif_duration(fps):
+    """
+    Duration of a GIF frame as imageio expects it: imageio 2.28 and newer write GIFs with Pillow, which takes
+    milliseconds, former versions took seconds.
+    """
+    import imageio
+
+    version = tuple(int(part) for part in imageio.__version__.split(".")[:2])
+    if version >= (2, 28):
+        return 1000 / fps
+    return 1 / fps
+
+
+def _as_bits(array):
+    # view any array as unsigned integers of the same size, for lossless bitwise differences
+    return np.ascontiguousarray(array).view(np.dtype("u" + str(array.dtype.itemsize)))
+
+
+def _lookup_table(colormap=None):
+    """
+    256 RGB colors as uint8 array
+    """
+    if colormap is None:
+        values = np.arange(256, dtype=np.uint8)
+        return np.stack([values, values, values], axis=-1)
+
+    from napari.utils.colormaps import ensure_colormap
+    colors = ensure_colormap(colormap).map(np.linspace(0, 1, 256))
+    return (colors[:, :3] * 255).astype(np.uint8)
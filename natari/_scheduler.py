@@ -0,0 +1,448 @@
+import threading
+import time
+import traceback
+
+import numpy as np
+
+
+class GameSession:
+    """
+    A game running in the background, e.g. in a napari viewer. The session can be started, paused, stopped and
+    restarted. All running sessions are ticked by one shared `Scheduler` thread.
+
+    The game needs an `inputs` queue, a `frame_delay` in seconds and the methods `game_step()`, `handle_inputs()`,
+    `render()` and `reset()`. Whatever `game_step()` or `render()` return is passed to `update` in the main thread.
+
+    Key bindings, dock widgets and layers belong to the session, so that several sessions can run side by side,
+    in one or in multiple viewers. Sessions with the same `name` in the same viewer replace each other.
+
+    If the game raises an error, the session is paused and the error is kept in `error`.
+    """
+    def __init__(self, game, update=None, viewer=None, name=None, scheduler=None):
+        self.game = game
+        self.update = update
+        self.viewer = viewer
+        self.name = name if name is not None else type(game).__name__
+        self.scheduler = scheduler if scheduler is not None else default_scheduler()
+        self.state = "stopped"
+        self.next_tick = 0
+        self.lock = threading.RLock()
+        self.dock_widgets = []
+        self.layers = {}
+        self._adopted = {}
+        self.recorder = None
+        self.bots = []
+        self.error = None
+        self._record_select = None
+        self._bindings = {}
+        self._former_bindings = {}
+        self._connections = []
+
+        if viewer is not None:
+            # a new session replaces the former one, before it binds keys
+            for other in self.scheduler.sessions_of(viewer, self.name):
+                other.stop()
+            _connect_viewer_closed(viewer, self.stop)
+
+    @property
+    def running(self):
+        return self.state == "running"
+
+    def bind_key(self, key, func):
+        """
+        Bind a key in the viewer to `func(viewer)`. Former bindings of the key are restored when the session stops.
+        """
+        if key not in self._former_bindings:
+            self._former_bindings[key] = _get_key_binding(self.viewer, key)
+        self._bindings[key] = func
+        self.viewer.bind_key(key, func, overwrite=True)
+
+    def adopt(self, key, layer):
+        """
+        Show data for `key` in an existing layer, e.g. an image layer the game is played on. Unlike the layers the
+        session creates, the layer stays when the session stops and gets its former data back.
+        """
+        self._adopted[key] = (layer, layer.data)
+        self.layers[key] = layer
+
+    def show(self, key, data, add_layer):
+        """
+        Update the layer this session created for `key` with new data or create it using `add_layer(data)`.
+        Must be called from the main thread, e.g. in the `update` function.
+        """
+        layer = self.layers.get(key)
+        if layer is not None and layer in self.viewer.layers:
+            layer.data = data
+        else:
+            self.layers[key] = add_layer(data)
+
+    def show_streamed(self, data, add_layer):
+        """
+        Show what a game renders with a `viewport`: an overview of the whole playground and on top of it the
+        visible part in full resolution. `add_layer(data, name, scale=..., translate=...)` creates an image layer.
+        """
+        for key in ['overview', 'viewport']:
+            image = data[key]
+            layer = self.layers.get(key)
+            if image is None:
+                if layer is not None:
+                    layer.visible = False
+                continue
+            scale, translate = data[key + '_scale'], data[key + '_translate']
+            self.show(key, image, lambda image, key=key: add_layer(image, name=key, scale=scale,
+                                                                   translate=translate))
+            layer = self.layers[key]
+            if not np.array_equal(layer.translate, translate):
+                layer.translate = translate
+            layer.visible = True
+
+    def follow_camera(self):
+        """
+        Tell the game which part of the playground is visible, whenever the viewer's camera moves or zooms.
+        """
+        def update_viewport(event=None):
+            self.game.viewport = _viewport_of(self.viewer)
+
+        self.connect(self.viewer.camera.events.center, update_viewport)
+        self.connect(self.viewer.camera.events.zoom, update_viewport)
+        update_viewport()
+
+    def connect(self, emitter, callback):
+        """
+        Connect a callback to an event of the viewer, it is disconnected when the session stops.
+        """
+        emitter.connect(callback)
+        self._connections.append((emitter, callback))
+
+    def record(self, path, select=None, **kwargs):
+        """
+        Record the frames of all game steps to a .gif, .mp4 or .npz file, see `natari._recorder.Recorder`.
+        Frames are written in the background; the game is never slowed down by recording.
+
+        Parameters
+        ----------
+        path: str or Path
+        select: callable, optional
+            returns the image to record from what a game step returns, e.g. `lambda data: data['playground']`.
+            By default, images and the 'playground' of dictionaries are recorded, or the 'overview' of streamed
+            playgrounds.
+        kwargs:
+            passed to the Recorder. Colormap and contrast limits default to the game's.
+
+        Raises
+        ------
+        ValueError
+            if there is no image to record, e.g. in "vector" render mode, or the file ending isn't supported
+        ImportError
+            if imageio is missing for .gif and .mp4 files
+        """
+        from ._recorder import Recorder
+
+        with self.lock:
+            if _select_frame(self.game.render(), select) is None:
+                raise ValueError("The game doesn't render images to record. Play it in 'raster' render mode or "
+                                 "pass `select` to choose an image.")
+
+        self.stop_recording()
+        kwargs.setdefault("fps", 1 / self.game.frame_delay)
+        for key in ["colormap", "contrast_limits"]:
+            if hasattr(self.game, key):
+                kwargs.setdefault(key, getattr(self.game, key))
+        self._record_select = select
+        self.recorder = Recorder(path, **kwargs)
+        return self.recorder
+
+    def stop_recording(self):
+        """
+        Finish writing the recording, if there is one.
+        """
+        recorder = self.recorder
+        self.recorder = None
+        if recorder is not None:
+            recorder.close()
+
+    def add_bot(self, bot):
+        """
+        Let a computer player, see `natari._bots`, play along. Bots act right before every game step.
+        """
+        self.bots.append(bot)
+
+    def add_dock_widget(self, widget, **kwargs):
+        """
+        Add a widget to the viewer, which is removed again when the session is stopped.
+        """
+        self.viewer.window.add_dock_widget(widget, **kwargs)
+        self.dock_widgets.append(widget)
+
+    def start(self):
+        """
+        Start or resume the game.
+        """
+        self.game.inputs.wake = self.scheduler.wake
+        self.next_tick = time.perf_counter()
+        self.error = None
+        self.state = "running"
+        self.scheduler.add(self)
+
+    def pause(self):
+        """
+        Stop ticking the game but keep its state, key bindings and widgets.
+        """
+        if self.state == "running":
+            self.state = "paused"
+
+    def resume(self):
+        if self.state == "paused":
+            self.game.inputs.drain()
+            self.start()
+
+    def stop(self, *args):
+        """
+        Stop the game for good and remove its widgets and layers from the viewer.
+        """
+        if self.state == "stopped":
+            return
+        self.state = "stopped"
+        self.scheduler.remove(self)
+        self.stop_recording()
+
+        for key, func in self._bindings.items():
+            try:
+                if _get_key_binding(self.viewer, key) is func:
+                    self.viewer.bind_key(key, self._former_bindings[key], overwrite=True)
+            except (AttributeError, RuntimeError, LookupError):
+                pass  # viewer was closed already
+        self._bindings = {}
+        self._former_bindings = {}
+
+        for emitter, callback in self._connections:
+            try:
+                emitter.disconnect(callback)
+            except (AttributeError, RuntimeError, LookupError, ValueError):
+                pass  # viewer was closed already
+        self._connections = []
+
+        for widget in self.dock_widgets:
+            try:
+                self.viewer.window.remove_dock_widget(widget)
+            except (AttributeError, RuntimeError, LookupError):
+                pass  # viewer was closed already
+        self.dock_widgets = []
+
+        # a new session of the game creates its layers again, adopted layers get their data back
+        for key, layer in self.layers.items():
+            try:
+                if key in self._adopted:
+                    layer.data = self._adopted[key][1]
+                elif layer in self.viewer.layers:
+                    self.viewer.layers.remove(layer)
+            except (AttributeError, RuntimeError, LookupError, ValueError):
+                pass  # viewer was closed already
+        self.layers = {}
+        self._adopted = {}
+
+    def restart(self):
+        """
+        Reset the game to its initial state and (re-)start it.
+        """
+        with self.lock:
+            self.game.reset()
+            self.game.inputs.drain()
+        self.start()
+
+    def tick(self, now):
+        """
+        Forward the game if it's due or apply pending input. Called from the scheduler thread.
+
+        Returns
+        -------
+            data to be shown in the viewer or None if nothing changed
+        """
+        with self.lock:
+            if self.state != "running":
+                return None
+            game = self.game
+            if now >= self.next_tick:
+                for bot in self.bots:
+                    bot.act()
+                data = game.game_step()
+                self.next_tick = max(self.next_tick + game.frame_delay, time.perf_counter())
+                self._record(data)
+                return data
+            if game.inputs.pending() and game.handle_inputs():
+                return game.render()
+        return None
+
+    def _record(self, data):
+        recorder = self.recorder
+        if recorder is None:
+            return
+        recorder.push(_select_frame(data, self._record_select))
+
+    def _dispatch(self, data):
+        """
+        Hand data over to the viewer, in the main thread.
+        """
+        if self.state != "stopped" and self.update is not None:
+            self.update(data)
+
+
+class Scheduler:
+    """
+    One background thread ticking all running game sessions. The thread wakes up when the next session is due
+    or when any game received input. It ends when the last session was stopped and starts again with the next
+    session. A session whose game raises an error is paused, see `GameSession.error`, the others keep running.
+    """
+    def __init__(self):
+        self.sessions = []
+        self.wake = threading.Event()
+        self._lock = threading.Lock()
+        self._running = False
+
+    def add(self, session):
+        with self._lock:
+            if session not in self.sessions:
+                self.sessions.append(session)
+            start_worker = not self._running
+            self._running = True
+        self.wake.set()
+
+        if start_worker:
+            from napari.qt.threading import thread_worker
+
+            worker = thread_worker(self.run)()
+            worker.yielded.connect(self._dispatch)
+            worker.start()
+
+    def remove(self, session):
+        with self._lock:
+            if session in self.sessions:
+                self.sessions.remove(session)
+        self.wake.set()
+
+    def sessions_of(self, viewer, name=None):
+        """
+        List the sessions running in a given viewer, optionally only those of one game.
+        """
+        with self._lock:
+            return [session for session in self.sessions
+                    if session.viewer is viewer and (name is None or session.name == name)]
+
+    def run(self):
+        """
+        Generator yielding (session, data) tuples, meant to run in a `thread_worker`.
+        """
+        try:
+            while True:
+                with self._lock:
+                    if len(self.sessions) == 0:
+                        self._running = False
+                        return
+                    sessions = list(self.sessions)
+
+                next_tick = time.perf_counter() + 1
+                for session in sessions:
+                    try:
+                        data = session.tick(time.perf_counter())
+                    except Exception as e:
+                        # a failing game, bot or connection pauses its own session only
+                        session.error = e
+                        session.pause()
+                        print("Paused " + session.name + " after an error:")
+                        traceback.print_exc()
+                        continue
+                    if data is not None:
+                        yield session, data
+                    if session.running:
+                        next_tick = min(next_tick, session.next_tick)
+
+                remaining = next_tick - time.perf_counter()
+                if remaining > 0:
+                    self.wake.wait(remaining)
+                self.wake.clear()
+        except BaseException:
+            # the worker crashed or was quit, the next session starts a new one
+            with self._lock:
+                self._running = False
+            raise
+
+    @staticmethod
+    def _dispatch(session_and_data):
+        session, data = session_and_data
+        session._dispatch(data)
+
+
+_default_scheduler = None
+
+
+def default_scheduler():
+    """
+    The scheduler shared by all games launched from the menu.
+    """
+    global _default_scheduler
+    if _default_scheduler is None:
+        _default_scheduler = Scheduler()
+    return _default_scheduler
+
+
+def stop_sessions(viewer, name=None, scheduler=None):
+    """
+    Stop the sessions of a game in a viewer, e.g. before a new session of the game prepares its layers.
+    """
+    scheduler = scheduler if scheduler is not None else default_scheduler()
+    for session in scheduler.sessions_of(viewer, name):
+        session.stop()
+
+
+def session_layers(viewer, scheduler=None):
+    """
+    The layers which game sessions created in a viewer, not counting adopted layers, as list
+    """
+    scheduler = scheduler if scheduler is not None else default_scheduler()
+    return [layer for session in scheduler.sessions_of(viewer) for key, layer in session.layers.items()
+            if key not in session._adopted]
+
+
+def _select_frame(data, select=None):
+    # the image to record from what a game step returns, or None
+    if select is not None:
+        return select(data)
+    if isinstance(data, dict):
+        return data.get('playground', data.get('overview'))
+    return data
+
+
+def _get_key_binding(viewer, key):
+    """
+    Returns the function bound to a key in the viewer or None.
+    """
+    try:
+        from napari.utils.key_bindings import normalize_key_combo
+        key = normalize_key_combo(key)
+    except ImportError:
+        pass
+    return viewer.keymap.get(key)
+
+
+def _viewport_of(viewer):
+    """
+    Returns the part of the 2D world visible in the viewer as (top, left, bottom, right).
+    """
+    center_y, center_x = viewer.camera.center[-2:]
+    try:
+        height, width = viewer._canvas_size
+    except (AttributeError, TypeError, ValueError):
+        height, width = 600, 800
+    zoom = viewer.camera.zoom
+    return (center_y - height / 2 / zoom, center_x - width / 2 / zoom,
+            center_y + height / 2 / zoom, center_x + width / 2 / zoom)
+
+
+def _connect_viewer_closed(viewer, callback):
+    """
+    Call `callback` when the viewer's window is closed.
+    """
+    try:
+        viewer.window._qt_window.destroyed.connect(callback)
+    except AttributeError:
+        pass  # headless viewer
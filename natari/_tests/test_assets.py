@@ -0,0 +1,48 @@
+from functools import partial
+
+import numpy as np
+
+from natari._assets import load_image
+
+
+def read_ones(path):
+    return np.ones((2, 3))
+
+
+def read_zeros(path):
+    return np.zeros((2, 3))
+
+
+def test_cache_distinguishes_readers(tmp_path, monkeypatch):
+    monkeypatch.setenv("NATARI_CACHE_DIR", str(tmp_path / "cache"))
+    path = tmp_path / "image.raw"
+    path.write_bytes(b"image")
+
+    assert np.all(load_image(path, reader=read_ones) == 1)
+    assert np.all(load_image(path, reader=read_zeros) == 0)
+    # both stay cached
+    assert np.all(load_image(path, reader=read_ones) == 1)
+    assert len(list((tmp_path / "cache").glob("*.npy"))) == 2
+
+
+def read_value(path, value):
+    return np.full((2, 3), value)
+
+
+def test_readers_without_stable_name(tmp_path, monkeypatch):
+    monkeypatch.setenv("NATARI_CACHE_DIR", str(tmp_path / "cache"))
+    path = tmp_path / "image.raw"
+    path.write_bytes(b"image")
+
+    # partials and lambdas share their names, they are not cached
+    assert np.all(load_image(path, reader=partial(read_value, value=1)) == 1)
+    assert np.all(load_image(path, reader=partial(read_value, value=2)) == 2)
+    assert np.all(load_image(path, reader=lambda path: read_value(path, 3)) == 3)
+    assert np.all(load_image(path, reader=lambda path: read_value(path, 4)) == 4)
+    assert not (tmp_path / "cache").exists()
+
+    # unless they are given a key
+    for value in [1, 2, 1]:
+        image = load_image(path, reader=partial(read_value, value=value), cache_key="value=" + str(value))
+        assert np.all(image == value)
+    assert len(list((tmp_path / "cache").glob("*.npy"))) == 2
@@ -0,0 +1,105 @@
+import numpy as np
+
+from natari.cell_counting_arcade import CellCountingArcade
+
+
+def z_stack():
+    # nucleus 1 is in front of nucleus 2, nucleus 3 is somewhere else
+    nuclei = np.zeros((3, 40, 50), dtype=np.uint16)
+    nuclei[0, 5:10, 5:10] = 1
+    nuclei[2, 5:15, 5:15] = 2
+    nuclei[1, 20:25, 30:35] = 3
+    image = nuclei.astype(float) * 10
+    return image, nuclei
+
+
+class ReadLog:
+    # array-like which records the regions read from it
+    def __init__(self, data):
+        self.data = data
+        self.shape = data.shape
+        self.reads = []
+
+    def __getitem__(self, index):
+        self.reads.append(index)
+        return self.data[index]
+
+
+def test_plane():
+    image, nuclei = z_stack()
+    game = CellCountingArcade([image], nuclei, nuclei, None, plane=2)
+    assert np.array_equal(game.nuclei, nuclei[2])
+    assert np.array_equal(game.channels[0], image[2])
+
+    game.remove(2)
+    assert not game.nuclei.any() and not game.cells.any()
+    # label 1 is not in this plane
+    game.remove(1)
+    assert not game.nuclei.any()
+
+
+def test_projection():
+    image, nuclei = z_stack()
+    game = CellCountingArcade([image], nuclei, nuclei, None, chunk_size=2)
+    expected = nuclei[2].copy()
+    expected[5:10, 5:10] = 1
+    expected[20:25, 30:35] = 3
+    assert np.array_equal(game.nuclei, expected)
+    assert np.array_equal(game.channels[0], image.max(axis=0))
+    assert game.nuclei_boxes[1:].tolist() == [[5, 5, 10, 10], [5, 5, 15, 15], [20, 30, 25, 35]]
+
+    # the nucleus behind shows up
+    game.remove(1)
+    expected[5:10, 5:10] = 2
+    assert np.array_equal(game.nuclei, expected)
+    assert np.array_equal(game.cells, expected)
+    game.remove(2)
+    expected[5:15, 5:15] = 0
+    assert np.array_equal(game.nuclei, expected)
+
+
+def test_removal_reads_bounding_box_only():
+    image, nuclei = z_stack()
+    data = ReadLog(nuclei)
+    game = CellCountingArcade([image], data, data, None, chunk_size=2)
+    data.reads.clear()
+
+    game.remove(1)
+    assert len(data.reads) > 0
+    for z, rows, columns in data.reads:
+        assert (rows.start, rows.stop, columns.start, columns.stop) == (5, 10, 5, 10)
+    assert np.array_equal(game.nuclei, game.project(nuclei, labels=True))
+
+
+def time_lapse():
+    # the nuclei move to the right
+    nuclei = np.zeros((2, 40, 50), dtype=np.uint16)
+    nuclei[0, 5:10, 5:10] = 1
+    nuclei[1, 5:10, 10:15] = 1
+    nuclei[:, 20:25, 30:35] = 2
+    return nuclei
+
+
+def test_next_time_point():
+    nuclei = time_lapse()
+    for tracked in [False, True]:
+        game = CellCountingArcade([nuclei * 10], nuclei, nuclei, None, axes="tyx", frame_steps=2, tracked=tracked)
+        game.remove(1)
+        assert not (game.nuclei == 1).any()
+
+        game.game_step()
+        assert game.time == 0
+        game.game_step()
+        assert game.time == 1
+        assert np.array_equal(game.channels[0], nuclei[1] * 10)
+        # tracked objects stay removed
+        assert (game.nuclei == 1).any() != tracked
+        assert (game.nuclei == 2).any()
+
+        # back to the first time point
+        game.remove(2)
+        game.game_step()
+        game.game_step()
+        assert game.time == 0
+        assert not (game.nuclei == 1).any()
+        assert (game.nuclei == 2).any() != tracked
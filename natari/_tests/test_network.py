@@ -0,0 +1,136 @@
+import asyncio
+import json
+
+from natari._input import InputQueue
+from natari._network import GameHost, apply_delta, diff_state, measure
+from natari import ping_pong
+from natari.snake import Game
+
+
+def test_delta_round_trip():
+    old = {"score": 1, "puck_x": 3.5, "body": [[3, 1], [2, 1], [1, 1]], "food": [[5, 5]], "gone": 1}
+    new = {"score": 1, "puck_x": 4.0, "body": [[4, 1], [3, 1], [2, 1], [1, 1]], "food": [[6, 6]], "new": [1]}
+
+    delta = diff_state(old, new)
+    assert "score" not in delta
+    # the moved snake is sent as its new head only
+    assert delta["body"] == {"prepend": [[4, 1]], "length": 4}
+    assert apply_delta(old, delta) == dict(new, gone=1)
+    assert apply_delta(None, diff_state(None, new)) == new
+
+
+def test_shifted_lists_round_trip():
+    body = [[i, 0] for i in range(10)]
+    for shift in range(4):
+        # moving by `shift` cells, growing or shrinking by one
+        for length in [len(body) - 1, len(body), len(body) + 1]:
+            moved = ([[-i, 0] for i in range(shift, 0, -1)] + body)[:length]
+            delta = diff_state({"body": body}, {"body": moved})
+            assert apply_delta({"body": body}, delta) == {"body": moved}
+
+
+def test_snake_states_round_trip():
+    game = Game(render_mode="vector", players=4, seed=1)
+    received = None
+    sent = None
+    for _ in range(50):
+        game.game_step()
+        state = game.state()
+        received = apply_delta(received, diff_state(sent, state))
+        sent = state
+        assert received == state
+
+
+def test_measure_over_tcp_and_unix_socket(tmp_path):
+    for path in [None, str(tmp_path / "natari.sock")]:
+        stats = measure(Game(render_mode="vector"), ticks=10, frame_delay=0.01, path=path)
+        assert stats["host"]["ticks"] == 10
+        assert all(client["ticks"] > 0 for client in stats["clients"])
+
+
+def test_remote_input_is_validated():
+    game = Game(render_mode="vector")
+    for args in [["up", 1], [True, 0], [1.0, 0], [1, 1], [[1], 0], [1], [None, None]]:
+        assert not game.remote_input(1, "direction", args)
+    assert not game.remote_input(3, "direction", [0, 1])
+    assert game.remote_input(2, "direction", [0, -1])
+
+    game = ping_pong.Game(render_mode="vector")
+    for args in [["10"], [True], [10.0], [[10]], [5], []]:
+        assert not game.remote_input(1, "move", args)
+    assert game.remote_input(2, "move", [-10])
+
+
+def test_bad_input_keeps_client_connected():
+    async def main():
+        game = Game(render_mode="vector")
+        host = GameHost(game)
+        address = await host.serve()
+        reader, writer = await asyncio.open_connection(*address)
+        await reader.readline()  # welcome
+        for message in ['{"action":"direction","args":["up",1]}', '[1, 2]', '"direction"', 'garbage',
+                        '{"action":"direction","args":[1,0]}']:
+            writer.write((message + "\n").encode("utf-8"))
+        await writer.drain()
+        await asyncio.sleep(0.1)
+        clients = len(host.clients)
+        writer.close()
+        await host.close()
+        return clients, game.inputs.drain()
+
+    clients, inputs = asyncio.run(main())
+    assert clients == 1
+    assert [(event.action, event.args) for event in inputs] == [("direction", (1, 1, 0))]
+
+
+class NoiseGame:
+    # a game whose whole state changes at every step
+    frame_delay = 0
+
+    def __init__(self):
+        self.inputs = InputQueue()
+        self.step = 0
+
+    def game_step(self):
+        self.step += 1
+
+    def state(self):
+        return {"step": self.step, "noise": [self.step * 1000 + i for i in range(5000)]}
+
+    def remote_input(self, player, action, args):
+        return False
+
+
+def test_stalled_client_is_skipped():
+    async def main():
+        game = NoiseGame()
+        host = GameHost(game, max_buffer=2 ** 16)
+        address = await host.serve()
+        reader, writer = await asyncio.open_connection(*address)
+        await asyncio.sleep(0.05)
+
+        # the client doesn't read while the host runs
+        await host.run(ticks=300)
+        buffered = host.clients[0].writer.transport.get_write_buffer_size()
+
+        # then it catches up while the host goes on
+        async def receive():
+            state = None
+            tick = 0
+            await reader.readline()  # welcome
+            while tick < 400:
+                message = json.loads(await reader.readline())
+                state = apply_delta(state, message["delta"])
+                tick = message["tick"]
+            return state
+
+        state, _ = await asyncio.wait_for(asyncio.gather(receive(), host.run(ticks=400)), timeout=30)
+        writer.close()
+        await host.close()
+        return host, buffered, state, game.state()
+
+    host, buffered, state, final_state = asyncio.run(main())
+    assert host.skipped > 0
+    # at most one message more than the limit
+    assert buffered < 2 ** 16 + 100000
+    assert state == final_state
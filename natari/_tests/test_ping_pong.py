@@ -0,0 +1,99 @@
+import numpy as np
+
+from natari.ping_pong import Game
+
+
+def test_fast_puck_bounces_off_bars():
+    game = Game(render_mode="vector")
+    game.frame_delay = game.physics_delay
+    game.puck_velocity_x = 200000  # 1000 pixels per physics step
+    # bars in front of the puck; hit in the center, it flies straight
+    game.player1_position = game.player2_position = game.puck_y
+    for _ in range(100):
+        game.game_step()
+        assert game.player1_x <= game.puck_x <= game.player2_x
+        assert 0 <= game.puck_y <= game.height
+    assert game.player1_score == game.player2_score == 0
+
+
+def test_fast_puck_passing_a_bar_scores():
+    game = Game(render_mode="vector")
+    game.frame_delay = game.physics_delay
+    game.puck_velocity_x = 200000
+    game.player2_position = game.height - game.bar_radius
+    game.puck_y = game.player2_position - game.bar_radius * 2
+    game.game_step()
+    assert game.player1_score == 1
+    assert game.player2_score == 0
+
+
+def test_same_seed_and_inputs_give_same_game():
+    def play(seed, frame_delay, steps):
+        game = Game(render_mode="vector", seed=seed)
+        game.frame_delay = frame_delay
+        moves = np.random.default_rng(0).choice([-10, 0, 10], size=(steps, 2))
+        for player1_move, player2_move in moves:
+            game.move_player(1, player1_move)
+            game.move_player(2, player2_move)
+            game.game_step()
+        return game.state(), game.time
+
+    assert play(3, 0.05, 400) == play(3, 0.05, 400)
+    assert play(3, 0.05, 400) != play(4, 0.05, 400)
+
+
+def test_physics_does_not_depend_on_frame_rate():
+    states = []
+    for frame_delay, steps in [(0.05, 100), (0.01, 500), (0.002, 2500)]:
+        game = Game(render_mode="vector", seed=1)
+        game.frame_delay = frame_delay
+        for _ in range(steps):
+            game.game_step()
+        assert game.physics_steps == 1000
+        states.append(game.state())
+    assert states[0] == states[1] == states[2]
+
+
+def test_puck_position_is_interpolated():
+    game = Game(render_mode="vector", seed=0)
+    game.frame_delay = game.physics_delay * 2.5
+    game.game_step()
+    assert game.physics_steps == 2
+
+    # half way between the last two physics steps
+    previous = np.asarray([game.previous_puck_x, game.previous_puck_y])
+    current = np.asarray([game.puck_x, game.puck_y])
+    assert not np.allclose(previous, current)
+    assert np.allclose(game.puck_position(), previous + (current - previous) * 0.5)
+
+    # right on a physics step, the puck is shown one step behind
+    game.game_step()
+    assert game.physics_steps == 5
+    assert np.allclose(game.puck_position(), [game.previous_puck_x, game.previous_puck_y])
+
+
+def world_center(image, value, scale=(1, 1), translate=(0, 0)):
+    # center of the pixels of the given value in world coordinates, as napari shows the image
+    rows, columns = np.nonzero(image == value)
+    return np.asarray([rows.mean(), columns.mean()]) * scale + translate
+
+
+def test_viewport_matches_playground():
+    game = Game(seed=0)
+    for _ in range(3):
+        game.game_step()
+    playground = game.render().copy()
+
+    game.viewport = (150.5, 200.2, 400, 500)
+    game.overview_size = 64
+    shown = game.render()
+    top, left = shown['viewport_translate']
+    view = shown['viewport']
+    assert np.array_equal(view, playground[top:top + view.shape[0], left:left + view.shape[1]])
+
+    # the overview shows it within one of its pixels
+    factor = shown['overview_scale'][0]
+    assert factor > 1
+    for value in [game.bar_value, game.puck_value]:
+        overview_center = world_center(shown['overview'], value, shown['overview_scale'], shown['overview_translate'])
+        assert np.all(np.abs(overview_center - world_center(playground, value)) <= factor)
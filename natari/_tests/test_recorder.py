@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from natari._recorder import Recorder, load_recording
+
+
+def test_gif_frame_durations(tmp_path):
+    pytest.importorskip("imageio")
+    Image = pytest.importorskip("PIL.Image")
+
+    path = tmp_path / "game.gif"
+    recorder = Recorder(path, fps=5, contrast_limits=(0, 10))
+    for i in range(3):
+        recorder.push(np.full((8, 8), i * 5, dtype=np.uint8))
+    recorder.close()
+    assert recorder.error is None
+
+    with Image.open(path) as gif:
+        durations = []
+        for i in range(gif.n_frames):
+            gif.seek(i)
+            durations.append(gif.info["duration"])
+        assert durations == [200] * 3
+        assert gif.info["loop"] == 0
+
+
+def test_npz_recording_is_lossless(tmp_path):
+    random = np.random.default_rng(0)
+    frames = [random.integers(0, 11, size=(20, 30), dtype=np.uint8) for _ in range(25)]
+    # frames of another size and dtype start a new chunk
+    frames += [random.random((5, 7)) for _ in range(3)]
+
+    path = tmp_path / "game.npz"
+    recorder = Recorder(path, chunk_size=10)
+    for frame in frames:
+        recorder.push(frame)
+    recorder.close()
+    assert recorder.error is None
+    assert recorder.written == len(frames) and recorder.dropped == 0
+
+    loaded = list(load_recording(path))
+    assert len(loaded) == len(frames)
+    for frame, loaded_frame in zip(frames, loaded):
+        assert loaded_frame.dtype == frame.dtype
+        assert np.array_equal(loaded_frame, frame)
+
+
+def test_missing_frames_are_dropped(tmp_path):
+    recorder = Recorder(tmp_path / "game.npz")
+    recorder.push(None)
+    recorder.close()
+    assert recorder.dropped == 1
+
+
+def test_unsupported_files_fail_early(tmp_path):
+    with pytest.raises(ValueError):
+        Recorder(tmp_path / "game.avi")
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from natari._input import InputQueue
+from natari._scheduler import GameSession, Scheduler, session_layers
+
+
+class CountingGame:
+    frame_delay = 0
+
+    def __init__(self, fail=False):
+        self.inputs = InputQueue()
+        self.fail = fail
+        self.steps = 0
+
+    def game_step(self):
+        self.steps += 1
+        if self.fail:
+            raise IndexError("broken game")
+        return self.steps
+
+    def handle_inputs(self):
+        return False
+
+    def render(self):
+        return self.steps
+
+    def reset(self):
+        self.steps = 0
+
+
+def test_failing_session_does_not_stop_others():
+    scheduler = Scheduler()
+    sessions = [GameSession(CountingGame(fail), scheduler=scheduler) for fail in [True, False]]
+    for session in sessions:
+        # started without napari's thread_worker, the scheduler is run below
+        session.state = "running"
+        scheduler.sessions.append(session)
+
+    ticks = scheduler.run()
+    shown = [next(ticks) for _ in range(10)]
+
+    broken, working = sessions
+    assert broken.state == "paused"
+    assert isinstance(broken.error, IndexError)
+    assert broken.game.steps == 1
+    assert working.state == "running"
+    assert working.error is None
+    assert [data for session, data in shown] == list(range(1, 11))
+    assert all(session is working for session, data in shown)
+
+
+class Layer:
+    def __init__(self, data, name):
+        self.data = data
+        self.name = name
+
+
+class Viewer:
+    # just the layer list of a napari viewer
+    def __init__(self):
+        self.layers = []
+
+    def add_image(self, data, name):
+        layer = Layer(data, name)
+        self.layers.append(layer)
+        return layer
+
+
+def test_stop_removes_layers_and_restores_adopted_ones():
+    viewer = Viewer()
+    scheduler = Scheduler()
+    own_image = viewer.add_image("original", "channel0")
+
+    session = GameSession(CountingGame(), viewer=viewer, name="game", scheduler=scheduler)
+    session.state = "running"
+    scheduler.sessions.append(session)
+    session.adopt("channel0", own_image)
+    session.show("channel0", "cropped", None)
+    session.show("result", "frame", lambda data: viewer.add_image(data, "result"))
+    assert own_image.data == "cropped"
+    assert session_layers(viewer, scheduler) == [viewer.layers[1]]
+
+    # a new session of the game replaces the former one and its layers
+    replacement = GameSession(CountingGame(), viewer=viewer, name="game", scheduler=scheduler)
+    assert session.state == "stopped"
+    assert viewer.layers == [own_image]
+    assert own_image.data == "original"
+    replacement.show("result", "frame", lambda data: viewer.add_image(data, "result"))
+    assert [layer.name for layer in viewer.layers] == ["channel0", "result"]
+
+
+def test_record_fails_early(tmp_path):
+    class ImageGame(CountingGame):
+        frame_delay = 0.1
+
+        def render(self):
+            return np.zeros((4, 4), dtype=np.uint8)
+
+    session = GameSession(ImageGame(), scheduler=Scheduler())
+    with pytest.raises(ValueError):
+        session.record(tmp_path / "game.avi")
+    # vector games return no image
+    session = GameSession(ImageGame(), scheduler=Scheduler())
+    session.game.render = lambda: {"players": np.zeros((0, 2))}
+    with pytest.raises(ValueError):
+        session.record(tmp_path / "game.npz")
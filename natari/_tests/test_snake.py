@@ -0,0 +1,142 @@
+import numpy as np
+
+from natari.snake import Game, SparseGrid
+
+
+def test_load_state_of_more_players():
+    host = Game(render_mode="vector", players=3, seed=0)
+    for _ in range(5):
+        host.game_step()
+
+    client = Game(render_mode="vector")
+    client.load_state(host.state())
+
+    assert client.players == 3
+    for player in range(1, 4):
+        assert np.array_equal(client.positions(player), host.positions(player))
+    assert np.array_equal(client.scores, host.scores)
+    client.render_mode = "raster"
+    assert client.render().shape == (host.height, host.width)
+
+
+def dense_grid(game):
+    # the occupancy of the playground computed from the snakes' bodies and the food
+    grid = np.zeros(game._grid().shape, dtype=int)
+    positions, players = game._bodies()
+    food = game.food_positions // game.pixel_size
+    grid[food[:, 1], food[:, 0]] = -1
+    grid[positions[:, 1] // game.pixel_size, positions[:, 0] // game.pixel_size] = players
+    return grid
+
+
+def test_grid_matches_bodies():
+    for seed in range(5):
+        game = Game(render_mode="vector", width=300, height=200, players=6, seed=seed)
+        random = np.random.default_rng(seed)
+        for _ in range(300):
+            for player in range(1, game.players + 1):
+                if random.random() < 0.3:
+                    game.set_direction(player, *[(0, 1), (1, 0), (0, -1), (-1, 0)][random.integers(4)])
+            game.game_step()
+            if game.game_over_countdown > 0:
+                continue
+            grid = game._grid()
+            assert np.array_equal(grid.window(0, 0, *grid.shape), dense_grid(game))
+            # a snake occupies as many cells as it is long, no cell twice
+            for player in np.nonzero(game.alive)[0] + 1:
+                body = game.positions(player)
+                assert len(np.unique(body, axis=0)) == len(body) == game.lengths[player - 1]
+
+
+def test_head_to_head_kills_both():
+    game = Game(render_mode="vector", players=2, seed=0)
+    # the two snakes start in the same row facing each other
+    distance = (game.positions(2)[0, 0] - game.positions(1)[0, 0]) // game.pixel_size
+    for _ in range(distance // 2 - 1):
+        game.game_step()
+    assert game.alive.all()
+    assert abs(game.positions(2)[0, 0] - game.positions(1)[0, 0]) == 2 * game.pixel_size
+
+    game.game_step()
+    assert not game.alive.any()
+    assert game.game_over_countdown > 0
+    assert len(game._grid().window(0, 0, *game._grid().shape).nonzero()[0]) == len(game.food_positions)
+
+
+def test_sparse_grid_matches_dense_array():
+    random = np.random.default_rng(0)
+    dense = np.zeros((30, 40), dtype=int)
+    grid = SparseGrid(30, 40)
+    for _ in range(200):
+        cells = np.stack([random.integers(0, 40, size=10), random.integers(0, 30, size=10)], axis=-1)
+        if random.random() < 0.3:
+            grid.clear(cells)
+            dense[cells[:, 1], cells[:, 0]] = 0
+        else:
+            values = random.integers(-1, 5, size=10)
+            grid.set(cells, values)
+            dense[cells[:, 1], cells[:, 0]] = values
+        assert np.array_equal(grid.get(cells), dense[cells[:, 1], cells[:, 0]])
+        assert len(grid) == np.count_nonzero(dense)
+    assert np.array_equal(grid.window(0, 0, 30, 40), dense)
+    assert np.array_equal(grid.window(-5, 10, 12, 100), dense[:12, 10:])
+
+
+def test_wall_outline_matches_raster_frame():
+    game = Game(width=200, height=120)
+    assert game.background(per_cell=True).shape == (1, 1)
+
+    frame = game.background()
+    top, left = game.wall()[0]
+    bottom, right = game.wall()[2]
+    rows = np.arange(int(top), int(bottom) + 1, 7)
+    columns = np.arange(int(left), int(right) + 1, 7)
+    # the outline runs through the frame, the cells next to it are empty
+    for row, column in [(top, columns), (bottom, columns), (rows, left), (rows, right)]:
+        row, column = np.round(row).astype(int), np.round(column).astype(int)
+        assert np.all(frame[np.minimum(row, game.height - 1), np.minimum(column, game.width - 1)] == 4)
+    assert np.all(frame[int(top) + game.pixel_size, int(left) + game.pixel_size:int(right) - game.pixel_size] == 0)
+
+
+def world_center(image, value, scale=(1, 1), translate=(0, 0)):
+    # center of the pixels of the given value in world coordinates, as napari shows the image
+    rows, columns = np.nonzero(image == value)
+    return np.asarray([rows.mean(), columns.mean()]) * scale + translate
+
+
+def test_viewport_matches_playground():
+    game = Game(seed=0)
+    game.game_step()
+    playground = game.render().copy()
+
+    game.viewport = (100, 100, 400, 600)
+    game.overview_size = 16
+    shown = game.render()
+    cell = game.pixel_size
+    factor = shown['overview_scale'][0] // cell
+    assert factor > 1
+    # snakes of players 1 and 2 and the food
+    for value in [2, 7, 10]:
+        center = world_center(playground, value)
+        viewport_center = world_center(shown['viewport'], value, shown['viewport_scale'], shown['viewport_translate'])
+        assert np.allclose(viewport_center, center)
+        # the overview shows it within one of its pixels
+        overview_center = world_center(shown['overview'], value, shown['overview_scale'], shown['overview_translate'])
+        assert np.all(np.abs(overview_center - center) <= factor * cell)
+
+
+def test_two_turns_within_one_step():
+    game = Game(render_mode="vector", seed=0)
+    game.game_step()
+    x, y = game.positions(1)[0]
+    # moving right, up and then left before the next step would be a reversal without the queue of turns
+    game.set_direction(1, -1, 0)
+    game.set_direction(1, 0, -1)
+
+    cell = game.pixel_size
+    game.game_step()
+    assert game.alive[0]
+    assert game.positions(1)[0].tolist() == [x, y - cell]
+    game.game_step()
+    assert game.alive[0]
+    assert game.positions(1)[0].tolist() == [x - cell, y - cell]
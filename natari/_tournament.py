@@ -0,0 +1,165 @@
+"""
+Headless matches between bots, played on all CPU cores. Useful for testing bots and measuring how fast the games
+step.
+
+Example:
+
+    >>> from natari._tournament import tournament
+    >>> stats = tournament("snake", matches=1000, seed=0)
+    >>> stats["win_rate"]
+"""
+import io
+import os
+import time
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def play_match(game_name, seed, max_steps=2000, points=5, game_kwargs=None):
+    """
+    Play one match between bots without viewer.
+
+    Parameters
+    ----------
+    game_name: str
+        "snake" or "ping_pong"
+    seed: int
+        seed of the game's random numbers, the same seed gives the same match
+    max_steps: int
+        the match ends with the higher score winning after this many steps
+    points: int
+        ping pong matches end when a player reaches this score
+    game_kwargs: dict, optional
+        passed to the game, e.g. {"players": 10} for snake
+
+    Returns
+    -------
+        dictionary with the winner (0 for a draw), the number of steps and timings in seconds
+    """
+    from ._bots import PingPongBot, SnakeBot
+
+    game_kwargs = dict(game_kwargs) if game_kwargs is not None else {}
+    game_kwargs.setdefault("render_mode", "vector")
+    # bots only measure their time budget, so that the same seed gives the same match on any computer
+    if game_name == "snake":
+        from .snake import Game
+        game = Game(seed=seed, **game_kwargs)
+        bots = [SnakeBot(game, player, stop_at_budget=False) for player in range(1, game.players + 1)]
+    elif game_name == "ping_pong":
+        from .ping_pong import Game
+        game = Game(seed=seed, **game_kwargs)
+        bots = [PingPongBot(game, player, stop_at_budget=False, seed=[seed, player]) for player in [1, 2]]
+    else:
+        raise ValueError("Unknown game: " + str(game_name))
+
+    step_time = 0
+    max_step_time = 0
+    winner = None
+    steps = 0
+    while winner is None and steps < max_steps:
+        for bot in bots:
+            bot.act()
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            # no "Game over!" messages
+            game.game_step()
+        duration = time.perf_counter() - start
+        step_time += duration
+        max_step_time = max(max_step_time, duration)
+        steps += 1
+        winner = _winner(game_name, game, points)
+
+    if winner is None:
+        # out of time, the higher score wins
+        scores = _scores(game_name, game)
+        winner = int(np.argmax(scores)) + 1 if np.count_nonzero(scores == scores.max()) == 1 else 0
+
+    return {
+        "winner": winner,
+        "steps": steps,
+        "step_time": step_time,
+        "max_step_time": max_step_time,
+        "bot_time": sum(bot.total_time for bot in bots),
+        "bot_ticks": sum(bot.ticks for bot in bots),
+        "max_bot_time": max(bot.max_time for bot in bots),
+        "bot_overruns": sum(bot.overruns for bot in bots),
+    }
+
+
+def _scores(game_name, game):
+    if game_name == "snake":
+        return np.asarray(game.scores)
+    return np.asarray([game.player1_score, game.player2_score])
+
+
+def _winner(game_name, game, points):
+    """
+    Returns the winning player, 0 for a draw or None while the match goes on
+    """
+    if game_name == "snake":
+        if game.game_over_countdown == 0:
+            return None
+        survivors = np.nonzero(game.alive)[0]
+        return int(survivors[0]) + 1 if len(survivors) == 1 else 0
+    scores = _scores(game_name, game)
+    if scores.max() < points:
+        return None
+    return int(np.argmax(scores)) + 1
+
+
+def _play(args):
+    return play_match(*args)
+
+
+def tournament(game_name="snake", matches=1000, seed=0, processes=None, max_steps=2000, points=5,
+               game_kwargs=None):
+    """
+    Play many matches between bots in a process pool and collect statistics. Match i is played with seed
+    `seed + i`, so a tournament can be repeated.
+
+    Parameters
+    ----------
+    game_name: str
+        "snake" or "ping_pong"
+    matches: int
+    seed: int
+    processes: int, optional
+        number of processes, defaults to the number of CPU cores
+    max_steps, points, game_kwargs:
+        see `play_match()`
+
+    Returns
+    -------
+        dictionary with wins and win rates per player, draws, steps and timings
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    start = time.perf_counter()
+    tasks = [(game_name, seed + i, max_steps, points, game_kwargs) for i in range(matches)]
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        results = list(executor.map(_play, tasks, chunksize=max(1, matches // (processes * 4))))
+    duration = time.perf_counter() - start
+
+    winners = np.asarray([result["winner"] for result in results])
+    steps = sum(result["steps"] for result in results)
+    bot_ticks = max(sum(result["bot_ticks"] for result in results), 1)
+    wins = {int(player): int(count) for player, count in zip(*np.unique(winners[winners > 0], return_counts=True))}
+    return {
+        "matches": matches,
+        "processes": processes,
+        "wins": wins,
+        "win_rate": {player: count / matches for player, count in wins.items()},
+        "draws": int(np.count_nonzero(winners == 0)),
+        "mean_steps": steps / max(matches, 1),
+        "duration": duration,
+        "matches_per_second": matches / duration,
+        "steps_per_second": steps / duration,
+        "mean_step_time_ms": sum(result["step_time"] for result in results) / max(steps, 1) * 1000,
+        "max_step_time_ms": max(result["max_step_time"] for result in results) * 1000,
+        "mean_bot_time_ms": sum(result["bot_time"] for result in results) / bot_ticks * 1000,
+        "max_bot_time_ms": max(result["max_bot_time"] for result in results) * 1000,
+        "bot_overruns": sum(result["bot_overruns"] for result in results),
+    }
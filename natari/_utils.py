@@ -1,2 +1,63 @@
+import numpy as np
+
+
 def draw_box(image, x, y, z, w, h, d, value=1):
-    image[int(y):int(y+h), int(x):int(x+w)].fill(value)
+    # works on images of any dtype, the value is converted to the image's dtype
+    # boxes sticking out at the top or left are cut, like those sticking out at the bottom or right
+    image[max(int(y), 0):max(int(y+h), 0), max(int(x), 0):max(int(x+w), 0)].fill(value)
+
+
+def draw_frame(image, y, x, h, w, value=1):
+    """
+    Draw the one pixel wide outline of a box with its top left corner at row `y` and column `x`. Parts outside the
+    image are cut.
+    """
+    draw_box(image, x, y, 0, w, 1, 1, value)
+    draw_box(image, x, y + h - 1, 0, w, 1, 1, value)
+    draw_box(image, x, y, 0, 1, h, 1, value)
+    draw_box(image, x + w - 1, y, 0, 1, h, 1, value)
+
+
+def draw_cells(image, positions, value=1):
+    """
+    Set single pixels at (n, 2) integer (x, y) positions to a value or to n values. Positions outside the image
+    are skipped. If positions repeat, the last one wins.
+    """
+    positions = np.asarray(positions, dtype=int).reshape(-1, 2)
+    inside = (positions[:, 0] >= 0) & (positions[:, 0] < image.shape[1]) & \
+             (positions[:, 1] >= 0) & (positions[:, 1] < image.shape[0])
+    if np.ndim(value) > 0:
+        value = np.asarray(value)[inside]
+    image[positions[inside, 1], positions[inside, 0]] = value
+
+
+def box_corners(x, y, w, h):
+    """
+    Corners of the box `draw_box()` would fill, as (row, column) coordinates for a napari Shapes layer.
+    """
+    top, left, bottom, right = int(y), int(x), int(y+h), int(x+w)
+    return np.asarray([[top, left], [top, right], [bottom, right], [bottom, left]], dtype=float) - 0.5
+
+
+def visible_region(viewport, width, height, max_size):
+    """
+    Cut a (top, left, bottom, right) viewport to an image of the given size.
+
+    Returns
+    -------
+        (top, left, bottom, right) integer bounds or None, if nothing is visible or the region is larger than
+        `max_size` in any direction
+    """
+    top, left, bottom, right = viewport
+    top, left = max(int(np.floor(top)), 0), max(int(np.floor(left)), 0)
+    bottom, right = min(int(np.ceil(bottom)) + 1, height), min(int(np.ceil(right)) + 1, width)
+    if bottom <= top or right <= left or bottom - top > max_size or right - left > max_size:
+        return None
+    return top, left, bottom, right
+
+
+def overview_factor(width, height, max_size):
+    """
+    Returns by which integer factor an image must be shrunk to be at most `max_size` pixels wide and high.
+    """
+    return max(int(np.ceil(max(width, height) / max_size)), 1)
@@ -20,110 +20,263 @@ player_fire_key = "9"
 #
 # We used image set BBBC022v1 [Gustafsdottir et al., PLOS ONE, 2013], available from the
 # Broad Bioimage Benchmark Collection [Ljosa et al., Nature Methods, 2012].
-from tifffile import imread
-
-import time
-import napari
-from napari._qt.qthreading import thread_worker
-from napari.types import LabelsData
+from typing import TYPE_CHECKING
 import numpy as np
-from pathlib import Path
-from ._utils import draw_box
-from napari_tools_menu import register_action
+from ._utils import draw_box, box_corners
+from ._input import InputQueue
+from ._scheduler import GameSession, session_layers, stop_sessions
+
+if TYPE_CHECKING:
+    import napari
+    from napari.types import LabelsData
 
 # The game
 class CellCountingArcade():
     """
     The game allows the player to shoot bullets from the bottom of the screen which move up and if they hit a nucleus
     it is removed from the image data in the viewer with the surrounding cell.
+
+    Nuclei, cells and images can be 2D, z-stacks and time-lapse data, see `axes`. Z-stacks are played in one plane or
+    projected through z, where bullets hit the front-most nucleus. Time-lapse data advance to the next time point
+    every `frame_steps` game iterations. Only the plane or projection of the current time point is kept in memory. It
+    is read in chunks of `chunk_size` planes, thus the data can also be memory-mapped, zarr or dask arrays.
     """
-    def __init__(self, images, nuclei : LabelsData, cells : LabelsData, viewer : napari.Viewer):
+    # the playground is a uint8 image: 1 for bullets and 2 for the player
+    colormap = 'gray'
+    contrast_limits = (0, 2)
+
+    def __init__(self, images, nuclei : "LabelsData", cells : "LabelsData", viewer : "napari.Viewer",
+                 render_mode="raster", axes : str = None, plane : int = None, frame_steps : int = 10,
+                 tracked : bool = False, chunk_size : int = 16):
+        """
+        The render_mode can be "raster" for drawing bullets and player into a playground image at every iteration or
+        "vector" for returning their coordinates only, see `sprites()`.
+
+        The axes of nuclei, cells and images are given like "zyx" or "tyx". By default, 2D, 3D and 4D data are "yx",
+        "zyx" and "tzyx". Bullets fly through the given z-plane or, if plane is None, through the projection. If
+        tracked, a label is the same object at all time points and hit objects are removed from all of them.
+        """
+        self.render_mode = render_mode
         self.images = images
-        self.nuclei = nuclei
-        self.cells = cells
+        self.initial_nuclei = nuclei
+        self.initial_cells = cells
         self.viewer = viewer
-        self.size = list(nuclei.shape)
-        self.size[1] = int(0.9 * self.size[1])
+        self.frame_delay = 0.1 # seconds
+        self.inputs = InputQueue()
+
+        if axes is None:
+            axes = {2: "yx", 3: "zyx", 4: "tzyx"}.get(len(nuclei.shape), "")
+        if len(axes) != len(nuclei.shape) or not axes.endswith("yx") or len(set(axes)) != len(axes) \
+                or not set(axes) <= set("tzyx"):
+            raise ValueError("Cannot play on data of shape " + str(nuclei.shape) + " with axes '" + axes + "'")
+        self.axes = axes
+        shape = dict(zip(axes, nuclei.shape))
+        self.frames = shape.get("t", 1)
+        self.depth = shape.get("z", 1)
+        self.plane = plane
+        self.frame_steps = frame_steps
+        self.tracked = tracked
+        self.chunk_size = chunk_size
+        self.reset()
+
+    def reset(self):
+        """
+        Bring back all cells, remove all bullets and put the player to the center.
+        """
+        height, width = self.initial_nuclei.shape[-2:]
+        self.size = [height, int(0.9 * width)]
         self.player_position = self.size[1] / 2
         self.bullets = []
-        self.playground = np.zeros(nuclei.shape)
-        self.fov_nuclei = np.zeros(nuclei.shape)
-        self.fov_cells = np.zeros(nuclei.shape)
+        self.playground = np.zeros((height, width), dtype=np.uint8)
 
         self.fov_x = 0
         self.fov_delta_x = 1
-        self.fov_max_x = nuclei.shape[1] - self.size[1]
+        self.fov_max_x = width - self.size[1]
+
+        self.steps = 0
+        self.time = 0
+        # removed labels per time point, or all under the key None if labels are tracked
+        self.removed = {}
+        self.load_time_point()
+
+    def load_time_point(self):
+        """
+        Read the plane or projection of nuclei, cells and images at the current time point and the bounding boxes
+        of all objects.
+        """
+        self.nuclei_boxes = np.zeros((0, 4), dtype=int)
+        self.cells_boxes = np.zeros((0, 4), dtype=int)
+        self.nuclei = self.project(self.initial_nuclei, labels=True, boxes="nuclei_boxes")
+        self.cells = self.project(self.initial_cells, labels=True, boxes="cells_boxes")
+        self.channels = [self.project(image) for image in self.images]
+
+    def project(self, data, labels=False, rows=slice(None), columns=slice(None), boxes=None):
+        """
+        Returns the plane of `data` at the current time point, or its projection through z: the front-most label
+        which wasn't removed or the maximum intensity. Bounding boxes of the labels read are merged into the
+        attribute named `boxes`.
+        """
+        removed = list(self.removed_labels())
+        planes = [self.plane] if self.plane is not None else \
+            [slice(z, z + self.chunk_size) for z in range(0, self.depth, self.chunk_size)]
+
+        result = None
+        for z in planes:
+            block = self._read(data, z, rows, columns)
+            if labels:
+                if boxes is not None:
+                    setattr(self, boxes, _merge_boxes(getattr(self, boxes), block))
+                if len(removed) > 0:
+                    block = np.where(np.isin(block, removed), 0, block)
+                projection = np.take_along_axis(block, np.argmax(block != 0, axis=0)[np.newaxis], axis=0)[0]
+                result = projection if result is None else np.where(result == 0, projection, result)
+            else:
+                projection = block.max(axis=0)
+                result = projection if result is None else np.maximum(result, projection)
+        return result
+
+    def _read(self, data, z, rows, columns):
+        # planes z (an index or a slice) of the current time point as (planes, rows, columns) numpy array
+        index = {"t": self.time, "z": z, "y": rows, "x": columns}
+        block = np.asarray(data[tuple(index[axis] for axis in self.axes)])
+        if "z" not in self.axes or not isinstance(z, slice):
+            block = block[np.newaxis]
+        return block
+
+    def removed_labels(self):
+        """
+        The set of labels removed at the current time point
+        """
+        return self.removed.setdefault(None if self.tracked else self.time, set())
+
+    def remove(self, label):
+        """
+        Remove the nucleus and the cell with the given label. Only their bounding boxes are updated in the
+        plane or projection, which then shows objects behind them.
+        """
+        self.removed_labels().add(label)
+        for view, data, boxes in [(self.nuclei, self.initial_nuclei, self.nuclei_boxes),
+                                  (self.cells, self.initial_cells, self.cells_boxes)]:
+            if label >= len(boxes) or boxes[label, 0] >= boxes[label, 2]:
+                continue
+            top, left, bottom, right = boxes[label]
+            region = view[top:bottom, left:right]
+            if self.plane is None:
+                region[:] = self.project(data, labels=True, rows=slice(top, bottom), columns=slice(left, right))
+            else:
+                region[region == label] = 0
 
     def move_player(self, delta):
         """
-        Move the player left/right.
+        Move the player left/right. The move is applied at the beginning of the next game iteration.
         """
-        if self.player_position + delta > 0 and self.player_position + delta < self.size[1]:
-            self.player_position += delta
+        self.inputs.put("move", delta)
 
     def fire(self):
         """
-        Shoot a bullet
+        Shoot a bullet. It is fired at the beginning of the next game iteration.
         """
-        self.bullets.append([self.player_position, 0])
+        self.inputs.put("fire")
 
-    def game_loop(self):
+    def handle_inputs(self):
         """
-        This function is called at every game iteration. It checks if bullets hit nuclei and redraws the playground
+        Apply all pending moves and shots. Returns True if the playground should be redrawn.
+        """
+        events = self.inputs.drain()
+        for event in events:
+            if event.action == "move":
+                delta = event.args[0]
+                if self.player_position + delta > 0 and self.player_position + delta < self.size[1]:
+                    self.player_position += delta
+            elif event.action == "fire":
+                self.bullets.append([self.player_position, 0])
+        return len(events) > 0
+
+    def render(self):
+        """
+        Redraw the playground only, e.g. after the player moved in between two game iterations.
+        """
+        if self.render_mode == "vector":
+            return self.sprites()
+        return {'playground': self.draw_playground()}
+
+    def sprites(self):
+        """
+        Bullets as (n, 2) array of square centers and the player as two boxes in a (2, 4, 2) array, in (row, column)
+        coordinates.
+        """
+        bullet_radius = 5
+        height = self.playground.shape[0]
+
+        bullets = np.asarray([[int(height - bullet[1]) + bullet_radius // 2, int(bullet[0]) + bullet_radius // 2]
+                              for bullet in self.bullets], dtype=float).reshape(-1, 2)
+        player = np.asarray([
+            box_corners(self.player_position - 5, height - 20, 10, 20),
+            box_corners(self.player_position - 15, height - 10, 30, 10),
+        ])
+        return {'bullets': bullets, 'player': player}
+
+    def draw_playground(self):
+        """
+        Draw bullets and player into an image.
         """
         bullet_radius = 5
 
         # empty playground
         self.playground.fill(0)
 
-        # pull nuclei from GPU so that we can access individual pixels
-        nuclei = np.asarray(self.nuclei)
-        # prepare all existing labels in a list. We set them to 0 in case a nucleus was hit
-        labels_to_keep = list(range(0, int(np.max(self.nuclei)+1)))
+        # draw bullets
+        for bullet in self.bullets:
+            draw_box(self.playground, bullet[0], self.playground.shape[0] - bullet[1], 0, bullet_radius, bullet_radius, 1, 1)
+
+        # draw player
+        draw_box(self.playground, self.player_position - 5, self.playground.shape[0] - 20, 0, 10, 20, 1, 2)
+        draw_box(self.playground, self.player_position - 15, self.playground.shape[0] - 10, 0, 30, 10, 1, 2)
+
+        return self.playground.copy()
+
+    def game_step(self):
+        """
+        This function is called at every game iteration. It checks if bullets hit nuclei and redraws the playground
+        """
+        self.handle_inputs()
+
+        height, width = self.nuclei.shape
 
         # future bullets to keep
         new_bullets = []
+        hit_labels = set()
 
         for bullet in self.bullets:
             bullet[1] += 10
 
             # check if a bullet has hit a nucleus
-            try:
-                label = nuclei[int(self.playground.shape[0] - bullet[1]), int(bullet[0] + self.fov_x)]
-            except IndexError:
-                label = 0
+            row, column = int(height - bullet[1]), int(bullet[0] + self.fov_x)
+            label = self.nuclei[row, column] if 0 <= row < height and 0 <= column < width else 0
             if label != 0: # bullet has hit a nucleus
-                labels_to_keep[label] = 0
+                hit_labels.add(int(label))
             elif bullet[1] > self.playground.shape[0]:
                 pass # bullet has left the playground
             else:
                 new_bullets.append(bullet)
-                # draw bullets
-                #self.playground[bullet[0]:bullet[0]+bullet_radius, self.playground.shape[0] - bullet[1] : self.playground.shape[0]].fill(1)
-                draw_box(self.playground, bullet[0], self.playground.shape[0] - bullet[1], 0, bullet_radius, bullet_radius, 1, 1)
         self.bullets = new_bullets
 
-        # only keep cells where the nuclei weren't hit
-        new_label_ids = np.asarray(labels_to_keep, np.uint8)
-        self.nuclei = np.take(new_label_ids, self.nuclei)
-        self.cells = np.take(new_label_ids, self.cells)
+        # remove nuclei which were hit together with their cells
+        for label in hit_labels:
+            self.remove(label)
 
         # make a binary image of areas to keep
-        binary = self.cells > 0
-
-        # draw player
-        draw_box(self.playground, self.player_position - 5, self.playground.shape[0] - 20, 0, 10, 20, 1, 2)
-        draw_box(self.playground, self.player_position - 15, self.playground.shape[0] - 10, 0, 30, 10, 1, 2)
+        binary = self.crop_fov(self.cells) > 0
 
         # collect all layers in a dictionary
         result = {}
-        for i, image in enumerate(self.images):
-            result["channel" + str(i)] = self.crop_fov(image * binary)
+        for i, channel in enumerate(self.channels):
+            result["channel" + str(i)] = self.crop_fov(channel) * binary
 
-        # add segmentation (invisble) and playground
-        result['nuclei'] = self.crop_fov(self.nuclei, self.fov_nuclei)
-        result['cells'] = self.crop_fov(self.cells, self.fov_cells)
-        result['playground'] = self.playground + 0
+        # add segmentation (invisble) and playground; copies, because hits change the labels in place
+        result['nuclei'] = self.crop_fov(self.nuclei).copy()
+        result['cells'] = self.crop_fov(self.cells).copy()
+        result.update(self.render())
 
         self.fov_x += self.fov_delta_x
         if self.fov_x <= 0:
@@ -133,98 +286,188 @@ class CellCountingArcade():
             self.fov_x = self.fov_max_x
             self.fov_delta_x = -1
 
+        # time-lapse data continue with the next time point
+        self.steps += 1
+        if self.frames > 1 and self.steps % self.frame_steps == 0:
+            self.time = (self.time + 1) % self.frames
+            self.load_time_point()
+
         return result
 
+    # former name of game_step
+    game_loop = game_step
+
     def crop_fov(self, image, output=None):
         return image[0:self.size[0], self.fov_x:self.fov_x+self.size[1]]
 
 
+def _merge_boxes(boxes, labels):
+    """
+    Extend bounding boxes by the objects in a (planes, rows, columns) block of labels. Row i of the (n, 4) boxes
+    array is [top, left, bottom, right] of label i, empty boxes have top >= bottom. Returns the boxes, grown if the
+    block contains larger labels.
+    """
+    from scipy.ndimage import find_objects
+
+    objects = find_objects(labels)
+    if len(objects) >= len(boxes):
+        grown = np.zeros((len(objects) + 1, 4), dtype=int)
+        grown[:, :2] = np.iinfo(int).max
+        grown[:len(boxes)] = boxes
+        boxes = grown
+
+    found = np.asarray([(i + 1, box[1].start, box[2].start, box[1].stop, box[2].stop)
+                        for i, box in enumerate(objects) if box is not None], dtype=int).reshape(-1, 5)
+    labels_found = found[:, 0]
+    boxes[labels_found, :2] = np.minimum(boxes[labels_found, :2], found[:, 1:3])
+    boxes[labels_found, 2:] = np.maximum(boxes[labels_found, 2:], found[:, 3:])
+    return boxes
+
+
+def segment(nuclei_image, axes : str = "yx", distance : int = 50):
+    """
+    Label nuclei by Otsu-thresholding and cells by expanding the nuclei by `distance` pixels. Works on 2D images and
+    z-stacks. Time-lapse data, with a "t" in axes, are segmented time point by time point.
+
+    Returns
+    -------
+        labels of nuclei and cells
+    """
+    from skimage.filters import threshold_otsu
+    from skimage.measure import label
+    from skimage.segmentation import expand_labels
+
+    if "t" in axes:
+        time_axis = axes.index("t")
+        segmented = [segment(np.take(nuclei_image, t, axis=time_axis), axes.replace("t", ""), distance)
+                     for t in range(nuclei_image.shape[time_axis])]
+        return np.stack([s[0] for s in segmented], axis=time_axis), np.stack([s[1] for s in segmented], axis=time_axis)
+
+    nuclei_image = np.asarray(nuclei_image)
+    binary_image = nuclei_image > threshold_otsu(nuclei_image)
+    labels_nuclei = label(binary_image)
+    labels_cells = expand_labels(labels_nuclei, distance=distance)
+    return np.asarray(labels_nuclei), np.asarray(labels_cells)
+
+
 
 colours = ['magenta', 'green', 'cyan', 'gray']
 
-@register_action(menu="Games > Cell counting arcade")
-def cell_counting_arcade_with_default_image(viewer : napari.Viewer):
+def cell_counting_arcade_with_default_image(viewer : "napari.Viewer"):
+    from ._assets import data_path, load_image
+
     viewer.title = "natari"
 
+    # the former game gives the channel layers their data back
+    stop_sessions(viewer, "cell_counting_arcade")
+
     images = []
-    data_path = Path(__file__).parent / "data"
-    dataset = imread(data_path / "IXMtest_A02_s9.tif")
+    dataset = load_image(data_path("IXMtest_A02_s9.tif"))
     nuclei_channel = 0
 
-    # add the original image channels as independent layers
+    # add the original image channels as independent layers, or reuse them when the game is launched again
     for i in range(0, dataset.shape[0]):
-        viewer.add_image(dataset[i], blending='additive', name="channel" + str(i), colormap=colours[i])
+        name = "channel" + str(i)
+        if name in viewer.layers:
+            viewer.layers[name].data = dataset[i]
+        else:
+            viewer.add_image(dataset[i], blending='additive', name=name, colormap=colours[i])
         images.append(dataset[i])
 
     # image segmentation: nuclei and cells
-    from skimage.filters import threshold_otsu
-    from skimage.measure import label
-    from skimage.segmentation import expand_labels
+    labels_nuclei, labels_cells = segment(dataset[nuclei_channel])
 
-    binary_image = dataset[nuclei_channel] > threshold_otsu(dataset[nuclei_channel])
-    labels_nuclei = label(binary_image)
-    labels_cells = expand_labels(labels_nuclei, distance=50)
+    return cell_counting_arcade(viewer, labels_nuclei, labels_cells)
 
-    cell_counting_arcade(viewer, np.asarray(labels_nuclei), np.asarray(labels_cells))
+def cell_counting_arcade(viewer : "napari.Viewer", labels_nuclei:"LabelsData", labels_cells:"LabelsData", keys : dict = None,
+                         name : str = "cell_counting_arcade", scheduler=None, render_mode : str = "raster",
+                         bot : bool = False, axes : str = None, plane : int = None, frame_steps : int = 10,
+                         tracked : bool = False):
+    """
+    Start the game on the image layers in the viewer. Keys can be customized, e.g. keys={"fire": "space"}.
+    Sessions with the same name in the same viewer replace each other. With render_mode="vector", bullets and
+    player are shown in Points and Shapes layers instead of a playground image. With bot=True, the computer
+    plays.
+    Z-stacks and time-lapse data are played plane by plane or projected, see `CellCountingArcade` for axes, plane,
+    frame_steps and tracked.
+    Returns the GameSession, which can be paused, restarted and stopped.
+    """
+    import napari
 
-def cell_counting_arcade(viewer : napari.Viewer, labels_nuclei:LabelsData, labels_cells:LabelsData):
+    # a former session of this game removes its layers, e.g. the playground and the cropped channels, and
+    # layers of other games are not played on
+    stop_sessions(viewer, name, scheduler)
+    game_layers = session_layers(viewer, scheduler)
 
     images = []
+    image_layers = []
     for l in viewer.layers:
-        if isinstance(l, napari.layers.Image):
+        if isinstance(l, napari.layers.Image) and not any(l is layer for layer in game_layers):
             images.append(l.data)
+            image_layers.append(l)
+
+    game = CellCountingArcade(images, labels_nuclei, labels_cells, viewer, render_mode=render_mode, axes=axes,
+                              plane=plane, frame_steps=frame_steps, tracked=tracked)
+    session = GameSession(game, viewer=viewer, name=name, scheduler=scheduler)
 
-    game = CellCountingArcade(images, labels_nuclei, labels_cells, viewer)
+    # channel layers which were added for the game are updated in place
+    for i, layer in enumerate(image_layers):
+        if layer.name == "channel" + str(i):
+            session.adopt(layer.name, layer)
 
     def update_layers(images_data: dict):
         """
         Add images to napari is layer or updates a pre-existing layer
         """
         for name in images_data.keys():
-            image = images_data[name]
-            for layer in viewer.layers:
-                if layer.name == name:
-                    layer.data = image
-                    image = None
-                    break
+            if "nuclei" in name or "cells" in name:
+                add_layer = lambda data, name=name: viewer.add_labels(data, name=name, visible=False)
+            elif name == "bullets":
+                add_layer = lambda data, name=name: viewer.add_points(data, name=name, symbol='square', size=5,
+                                                                      face_color='gray', edge_width=0)
+            elif name == "player":
+                add_layer = lambda data, name=name: viewer.add_shapes(data, name=name, shape_type='rectangle',
+                                                                      face_color='white', edge_width=0)
+            elif name == "playground":
+                add_layer = lambda data, name=name: viewer.add_image(data, name=name, blending='additive',
+                                                                     contrast_limits=game.contrast_limits,
+                                                                     colormap=game.colormap)
+            else:
+                add_layer = lambda data, name=name: viewer.add_image(data, name=name, blending='additive')
+            session.show(name, images_data[name], add_layer)
 
-            if image is not None:
-                if "nuclei" in name or "cells" in name:
-                    viewer.add_labels(image, name=name, visible=False)
-                else:
-                    viewer.add_image(image, name=name, blending='additive')
+    player_keys = {
+        "left": player_left_key,
+        "right": player_right_key,
+        "fire": player_fire_key,
+    }
+    if keys is not None:
+        player_keys.update(keys)
 
-    print("setting key bindings: ", player_left_key, player_right_key, player_fire_key)
+    print("setting key bindings: ", player_keys["left"], player_keys["right"], player_keys["fire"])
 
     # Key bindings for the game
-    @viewer.bind_key(player_left_key)
     def player_left_event(viewer):
         game.move_player(-10)
 
-    @viewer.bind_key(player_right_key)
     def player_right_event(viewer):
         game.move_player(10)
 
-    @viewer.bind_key(player_fire_key)
-    def player_left_event(viewer):
+    def player_fire_event(viewer):
         game.fire()
 
+    session.bind_key(player_keys["left"], player_left_event)
+    session.bind_key(player_keys["right"], player_right_event)
+    session.bind_key(player_keys["fire"], player_fire_event)
+
+    if bot:
+        from ._bots import ArcadeBot
+        session.add_bot(ArcadeBot(game))
+
     print("Starting game loop")
 
     # Game loop, runs in the background
     # https://napari.org/guides/stable/threading.html
-    @thread_worker
-    def loop_run():
-        while True:  # endless loop
-            data = game.game_loop()
-            yield data
-            time.sleep(0.1)
-
-    # Start the loop
-    worker = loop_run()
-    worker.yielded.connect(update_layers)
-    worker.start()
-
-    # napari.run()
-
-
+    session.update = update_layers
+    session.start()
+    return session
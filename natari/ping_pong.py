@@ -12,106 +12,311 @@ player2_down_key = 'k'
 # Have fun!
 #   @haesleinhuepf
 
-import time
-import napari
-from napari.qt.threading import thread_worker
-from qtpy.QtWidgets import QLineEdit, QLabel, QWidget, QVBoxLayout
+from typing import TYPE_CHECKING
 import numpy as np
-from ._utils import draw_box
-from napari_tools_menu import register_action
+from ._utils import draw_box, box_corners, overview_factor, visible_region
+from ._input import InputQueue
+from ._scheduler import GameSession
 
-class Game:
+if TYPE_CHECKING:
+    import napari
 
-    def __init__(self):
+class Game:
+    # frames are uint8 images: 0 for the bars, 1 for the playground and 10 for the puck, shown in black, dark gray
+    # and white
+    colormap = 'gray'
+    contrast_limits = (0, 10)
+    bar_value = 0
+    background_value = 1
+    puck_value = 10
+
+    def __init__(self, render_mode="raster", width=640, height=480, seed=None):
         """ Setup the game
+
+        Parameters
+        ----------
+        render_mode: str
+            "raster" for drawing the whole playground into an image at every step or "vector" for returning
+            the corners of bars and puck only, see `sprites()`
+        width, height: int
+            size of the playground in pixels. Large playgrounds should be shown using a `viewport`.
+        seed: int, optional
+            if given, the puck is served at a random angle, which is the same for the same seed
         """
-        self.player1_position = 200
-        self.player2_position = 280
+        self.render_mode = render_mode
+        self.frame_delay = 0.05 # seconds
+        self.physics_delay = 0.005 # seconds
+        self.inputs = InputQueue()
+        self.seed = seed
+        self.random = np.random.default_rng(seed)
+
+        self.width = width
+        self.height = height
+
+        # part of the playground to render as (top, left, bottom, right) in pixels, None for all of it
+        self.viewport = None
+        self.maximum_viewport_size = 2048 # pixels
+        self.overview_size = 512 # pixels
+
+        self.reset()
+
+    def reset(self):
+        """ Put players and puck to their start positions and set the score to 0:0
+        """
+        self.player1_position = self.height / 2 - 40
+        self.player2_position = self.height / 2 + 40
 
         self.player1_x = 10
-        self.player2_x = 630
+        self.player2_x = self.width - 10
 
         self.player1_score = 0
         self.player2_score = 0
 
-        self.width = 640
-        self.height = 480
-        self.playground = np.zeros([self.height, self.width])
+        # the full-size image is only allocated when it is drawn without viewport
+        self.playground = None
 
         self.bar_radius = 50
 
         self.puck_x = self.width / 2
         self.puck_y = self.height / 2
-        self.puck_delta_x = 10
-        self.puck_delta_y = 0
+        self.previous_puck_x = self.puck_x
+        self.previous_puck_y = self.puck_y
+        self.puck_velocity_x = 200 # pixels per second
+        self.puck_velocity_y = 0 if self.seed is None else self.random.uniform(-100, 100)
+
+        # seconds played and physics steps done
+        self.time = 0
+        self.physics_steps = 0
+
+    def move_player(self, player, delta):
+        """Move a player's bar up (negative delta) or down. Can be called from any thread, the move is applied
+        at the beginning of the next game step.
+        """
+        self.inputs.put("move", player, delta)
+
+    def handle_inputs(self):
+        """Apply all pending key presses.
 
-        self.result_label = QLabel()
+        Returns
+        -------
+            True if a player moved and the playground should be redrawn
+        """
+        events = self.inputs.drain()
+        for event in events:
+            player, delta = event.args
+            if player == 1:
+                self.player1_position = self._check_player_position(self.player1_position + delta)
+            else:
+                self.player2_position = self._check_player_position(self.player2_position + delta)
+        return len(events) > 0
 
     def game_step(self):
-        """Forwards the game by one step and computes the new playground
+        """Forwards the game by `frame_delay` and computes the new playground. The puck is moved by
+        `physics_step()` at a fixed rate, independent of how often the game is rendered. Thus, a game played with
+        the same inputs at the same steps always ends the same.
 
         Returns
         -------
             an image with the current state of the game
         """
+        self.handle_inputs()
 
         # check player positions
         self.player1_position = self._check_player_position(self.player1_position)
         self.player2_position = self._check_player_position(self.player2_position)
 
-        # move puck
-        self.puck_x = self.puck_x + self.puck_delta_x
-        self.puck_y = self.puck_y + self.puck_delta_y
-
-        # check puck_position
-        if self.puck_y < 0 or self.puck_y > self.height:
-            self.puck_delta_y = -self.puck_delta_y
-            self.puck_y = self.puck_y + self.puck_delta_y
+        # catch up with the physics; counting steps instead of summing up time doesn't accumulate rounding errors
+        self.time = self.time + self.frame_delay
+        while self.physics_steps < int(self.time / self.physics_delay + 1e-6):
+            self.previous_puck_x, self.previous_puck_y = self.puck_x, self.puck_y
+            self.physics_step(self.physics_delay)
+            self.physics_steps = self.physics_steps + 1
 
-        # puck at player 1
-        if self.puck_x <= self.player1_x:
-            self.puck_delta_x = -self.puck_delta_x
-            self.puck_x = self.puck_x + self.puck_delta_x
+        return self.render()
 
-            if abs(self.puck_y - self.player1_position) > self.bar_radius:
-                # player 2 scores
-                self.player2_score = self.player2_score + 1
+    def physics_step(self, delta_time):
+        """Move the puck by `delta_time` seconds. Collisions are swept: whenever the puck's path crosses a wall
+        or a bar's line during the step, it bounces there, no matter how fast it is.
+        """
+        remaining = delta_time
+        for _ in range(8):
+            # find the first wall or bar line the puck reaches in the remaining time
+            time_to_hit, hit = remaining, None
+            for line, position, velocity, reached in [
+                ("top", self.puck_y, self.puck_velocity_y, lambda p: p < 0),
+                ("bottom", self.puck_y, self.puck_velocity_y, lambda p: p > self.height),
+                ("player1", self.puck_x, self.puck_velocity_x, lambda p: p <= self.player1_x),
+                ("player2", self.puck_x, self.puck_velocity_x, lambda p: p >= self.player2_x),
+            ]:
+                if velocity != 0 and not reached(position) and reached(position + velocity * remaining):
+                    target = {"top": 0, "bottom": self.height, "player1": self.player1_x,
+                              "player2": self.player2_x}[line]
+                    time = (target - position) / velocity
+                    if time <= time_to_hit:
+                        time_to_hit, hit = time, line
+
+            self.puck_x = self.puck_x + self.puck_velocity_x * time_to_hit
+            self.puck_y = self.puck_y + self.puck_velocity_y * time_to_hit
+            remaining = remaining - time_to_hit
+            if hit is None:
+                return
+
+            if hit in ["top", "bottom"]:
+                self.puck_velocity_y = -self.puck_velocity_y
+                continue
+
+            self.puck_velocity_x = -self.puck_velocity_x
+            bar_position = self.player1_position if hit == "player1" else self.player2_position
+            if abs(self.puck_y - bar_position) > self.bar_radius:
+                # the other player scores
+                if hit == "player1":
+                    self.player2_score = self.player2_score + 1
+                else:
+                    self.player1_score = self.player1_score + 1
                 self._level_up()
-            else:
-                self.puck_delta_y = (self.puck_y - self.player1_position) / self.bar_radius * 5
+                return
+            self.puck_velocity_y = (self.puck_y - bar_position) / self.bar_radius * 100
 
-        # puck at player 2
-        if self.puck_x >= self.player2_x:
-            self.puck_delta_x = -self.puck_delta_x
-            self.puck_x = self.puck_x + self.puck_delta_x
+    def puck_position(self):
+        """Returns the puck position to show, interpolated between the last two physics steps. It is up to one
+        physics step behind.
+        """
+        alpha = min(max(self.time / self.physics_delay - self.physics_steps, 0), 1)
+        return self.previous_puck_x + (self.puck_x - self.previous_puck_x) * alpha, \
+            self.previous_puck_y + (self.puck_y - self.previous_puck_y) * alpha
 
-            if abs(self.puck_y - self.player2_position) > self.bar_radius:
-                # player 1 scores
-                self.player1_score = self.player1_score + 1
-                self._level_up()
-            else:
-                self.puck_delta_y = (self.puck_y - self.player2_position) / self.bar_radius * 5
+    # the entries of `state()`, the only attributes `load_state()` may set
+    state_keys = ['player1_position', 'player2_position', 'player1_score', 'player2_score', 'bar_radius', 'puck_x',
+                  'puck_y']
 
-        # show game status
-        self.result_label.setText(str(self.player1_score) + ":" + str(self.player2_score))
+    def state(self):
+        """Returns the state of the game which changes from step to step, e.g. for sending it over the network.
+        Positions are floats, so that they can be interpolated.
+        """
+        return {
+            'player1_position': float(self.player1_position),
+            'player2_position': float(self.player2_position),
+            'player1_score': self.player1_score,
+            'player2_score': self.player2_score,
+            'bar_radius': self.bar_radius,
+            'puck_x': float(self.puck_x),
+            'puck_y': float(self.puck_y),
+        }
+
+    def load_state(self, state):
+        """Overwrite the game state with a state as returned by `state()`. Unknown entries are ignored.
+        """
+        for key, value in state.items():
+            if key in self.state_keys:
+                setattr(self, key, value)
+        self.previous_puck_x, self.previous_puck_y = self.puck_x, self.puck_y
 
-        # draw playground
-        self.playground.fill(0.1)
+    def remote_input(self, player, action, args):
+        """Queue input received over the network, if it's valid. Returns True if the input was accepted.
+        """
+        if action != "move" or player not in [1, 2] or len(args) != 1 or not isinstance(args[0], int) or \
+            isinstance(args[0], bool) or args[0] not in [-10, 10]:
+            return False
+        self.inputs.put("move", player, args[0])
+        return True
+
+    def status(self):
+        """Returns the current score as text
+        """
+        return str(self.player1_score) + ":" + str(self.player2_score)
 
-        # draw player 1
-        draw_box(self.playground, self.player1_x, self.player1_position - self.bar_radius, 0, 10, self.bar_radius * 2, 0)
+    def render(self):
+        """Draws the current state of the game
 
-        # draw player 2
-        draw_box(self.playground, self.player2_x, self.player2_position - self.bar_radius, 0, 10, self.bar_radius * 2, 0)
+        Returns
+        -------
+            an image with the current state of the game, or a dictionary of sprites in "vector" render mode
+        """
+        if self.render_mode == "vector":
+            return self.sprites()
+        if self.viewport is not None:
+            return self.render_viewport()
 
-        # draw puck
-        draw_box(self.playground, self.puck_x, self.puck_y, 0, 10, 5, 1)
+        if self.playground is None:
+            self.playground = np.zeros([self.height, self.width], dtype=np.uint8)
+
+        # draw playground
+        self.playground.fill(self.background_value)
+        self._draw(self.playground)
 
         # return playground
         image = self.playground
 
         return image
 
+    def render_viewport(self):
+        """Draws the part of the playground inside the `viewport` and an overview of the whole playground.
+        The effort depends on the size of the viewport, not on the size of the playground.
+
+        Returns
+        -------
+            a dictionary with the 'viewport' and 'overview' images and their scale and translation in pixels of
+            the full playground. The viewport is None if it is larger than `maximum_viewport_size` pixels.
+        """
+        view = None
+        origin = (0, 0)
+        region = visible_region(self.viewport, self.width, self.height, self.maximum_viewport_size)
+        if region is not None:
+            top, left, bottom, right = region
+            view = np.full([bottom - top, right - left], self.background_value, dtype=np.uint8)
+            origin = (top, left)
+            self._draw(view, left, top)
+
+        factor = overview_factor(self.width, self.height, self.overview_size)
+        overview = np.full([int(np.ceil(self.height / factor)), int(np.ceil(self.width / factor))],
+                           self.background_value, dtype=np.uint8)
+        self._draw(overview, factor=factor)
+
+        return {
+            'viewport': view,
+            'viewport_scale': (1, 1),
+            'viewport_translate': origin,
+            'overview': overview,
+            'overview_scale': (factor, factor),
+            'overview_translate': ((factor - 1) / 2,) * 2,
+        }
+
+    def _draw(self, image, left=0, top=0, factor=1):
+        """Draw bars and puck into an image showing the playground from (`left`, `top`) on, shrunk by `factor`.
+        Bars and puck stay at least one pixel large.
+        """
+        def box(x, y, w, h, value):
+            draw_box(image, (x - left) // factor, (y - top) // factor, 0, max(w // factor, 1), max(h // factor, 1), 1,
+                     value)
+
+        # draw players
+        box(self.player1_x, self.player1_position - self.bar_radius, 10, self.bar_radius * 2, self.bar_value)
+        box(self.player2_x, self.player2_position - self.bar_radius, 10, self.bar_radius * 2, self.bar_value)
+
+        # draw puck
+        puck_x, puck_y = self.puck_position()
+        box(puck_x, puck_y, 10, 5, self.puck_value)
+
+    def background(self, per_cell=False):
+        """Returns the empty playground, which doesn't change during the game. With `per_cell`, it is a single
+        pixel which must be shown scaled to `height` and `width`, which saves memory for large playgrounds.
+        """
+        if per_cell:
+            return np.full([1, 1], self.background_value, dtype=np.uint8)
+        return np.full([self.height, self.width], self.background_value, dtype=np.uint8)
+
+    def sprites(self):
+        """Returns the corners of the bars and the puck as they would be drawn by `render()`, in a dictionary
+        of (n, 4, 2) arrays
+        """
+        return {
+            'bars': np.asarray([
+                box_corners(self.player1_x, self.player1_position - self.bar_radius, 10, self.bar_radius * 2),
+                box_corners(self.player2_x, self.player2_position - self.bar_radius, 10, self.bar_radius * 2),
+            ]),
+            'puck': np.asarray([box_corners(*self.puck_position(), 10, 5)]),
+        }
+
     def _check_player_position(self, position):
         """Checks if a player went out of the playground
 
@@ -141,60 +346,122 @@ class Game:
         if self.bar_radius > 10:
             self.bar_radius = self.bar_radius - 10
         else:
-            self.puck_delta_x = self.puck_delta_x / abs(self.puck_delta_x) * (abs(self.puck_delta_x) + 10)
+            self.puck_velocity_x = self.puck_velocity_x / abs(self.puck_velocity_x) * (abs(self.puck_velocity_x) + 200)
 
         self.puck_x = self.width / 2
         self.puck_y = self.height / 2
+        # don't interpolate the jump to the center
+        self.previous_puck_x = self.puck_x
+        self.previous_puck_y = self.puck_y
+
+def ping_pong(viewer : "napari.Viewer"):
+    return start_ping_pong(viewer)
+
+
+def start_ping_pong(viewer : "napari.Viewer", keys : dict = None, name : str = "ping_pong", scheduler=None,
+                    render_mode : str = "raster", game : "Game" = None, width : int = 640, height : int = 480,
+                    streaming : bool = None, bots : int = 0):
+    """Start a ping pong session in a viewer.
+
+    Parameters
+    ----------
+    viewer: napari.Viewer
+    keys: dict, optional
+        keys for the players, e.g. {"player1_up": "w"}. Defaults to the keys defined at the top of this module.
+    name: str, optional
+        sessions with the same name in the same viewer replace each other
+    scheduler: Scheduler, optional
+        background thread to run the game in, defaults to the one shared by all games
+    render_mode: str, optional
+        "raster" sends an image of the playground to the viewer at every step, "vector" uploads the playground
+        once and only updates the corners of bars and puck in Shapes layers
+    game: Game, optional
+        an already set up game, e.g. a `natari._network.RemoteGame` for joining a game hosted elsewhere.
+        Its render mode must match `render_mode`.
+    width, height: int, optional
+        size of the playground in pixels
+    streaming: bool, optional
+        only render the part of the playground visible in the viewer, plus a low resolution overview. By default,
+        playgrounds larger than 2048 pixels are streamed.
+    bots: int, optional
+        number of players steered by the computer: 1 for player 2, 2 for both.
+
+    Returns
+    -------
+        the GameSession, which can be paused, restarted and stopped
+    """
+    from qtpy.QtWidgets import QLabel, QWidget, QVBoxLayout
 
-@register_action(menu="Games > Ping pong")
-def ping_pong(viewer : napari.Viewer):
     viewer.title = "natari"
 
-    game = Game()
+    if game is None:
+        game = Game(render_mode=render_mode, width=width, height=height)
+    if streaming is None:
+        streaming = max(game.width, game.height) > 2048
+    session = GameSession(game, viewer=viewer, name=name, scheduler=scheduler)
 
     # Key bindings for user control
-    @viewer.bind_key(player1_up_key)
-    def player1_up_event(viewer):
-        game.player1_position = game.player1_position - 10
-
-    @viewer.bind_key(player1_down_key)
-    def player1_down_event(viewer):
-        game.player1_position = game.player1_position + 10
-
-    @viewer.bind_key(player2_up_key)
-    def player2_up_event(viewer):
-        game.player2_position = game.player2_position - 10
-
-    @viewer.bind_key(player2_down_key)
-    def player2_down_event(viewer):
-        game.player2_position = game.player2_position + 10
+    player_keys = {
+        "player1_up": player1_up_key,
+        "player1_down": player1_down_key,
+        "player2_up": player2_up_key,
+        "player2_down": player2_down_key,
+    }
+    if keys is not None:
+        player_keys.update(keys)
+
+    for action, key in player_keys.items():
+        player = 1 if action.startswith("player1") else 2
+        if player > 2 - bots:
+            continue
+        delta = -10 if action.endswith("up") else 10
+        session.bind_key(key, lambda viewer, player=player, delta=delta: game.move_player(player, delta))
+
+    from ._bots import PingPongBot
+    for player in range(3 - bots, 3):
+        session.add_bot(PingPongBot(game, player))
 
     # Graphical user interface
     widget = QWidget()
     layout = QVBoxLayout()
     widget.setLayout(layout)
 
-    layout.addWidget(game.result_label)
-    viewer.window.add_dock_widget(widget, area="bottom")
-    game.result_label.setText(str("0:0"))
+    result_label = QLabel()
+    layout.addWidget(result_label)
+    session.add_dock_widget(widget, area="bottom")
+    result_label.setText(str("0:0"))
 
     # Multi-threaded interaction
     # inspired by https://napari.org/docs/dev/events/threading.html
+    def add_result(data, name='result', **kwargs):
+        return viewer.add_image(data, name=name, contrast_limits=game.contrast_limits, colormap=game.colormap,
+                                **kwargs)
+
     def update_layer(new_image):
-        try:
-            viewer.layers['result'].data = new_image
-        except KeyError:
-            viewer.add_image(
-                new_image, name='result', contrast_limits=(0, 1)
-            )
-
-    @thread_worker
-    def yield_random_images_forever():
-        while True:  # infinite loop!
-            yield game.game_step()
-            time.sleep(0.05)
-
-    # Start the game loop
-    worker = yield_random_images_forever()
-    worker.yielded.connect(update_layer)
-    worker.start()
+        result_label.setText(game.status())
+        if render_mode == "vector":
+            # the colors of the raster mode: black bars, white puck
+            for name, color in [('bars', 'black'), ('puck', 'white')]:
+                session.show(name, new_image[name], lambda data, name=name, color=color: viewer.add_shapes(
+                    data, shape_type='rectangle', name=name, face_color=color, edge_width=0
+                ))
+        elif streaming:
+            session.show_streamed(new_image, add_result)
+        else:
+            session.show('result', new_image, add_result)
+
+    if render_mode == "vector" and streaming:
+        session.show('result', game.background(per_cell=True), lambda data: add_result(
+            data, scale=(game.height, game.width), translate=((game.height - 1) / 2, (game.width - 1) / 2)))
+    elif render_mode == "vector":
+        session.show('result', game.background(), add_result)
+    if streaming:
+        viewer.camera.center = (game.height / 2, game.width / 2)
+        viewer.camera.zoom = 1
+    if streaming and render_mode != "vector":
+        session.follow_camera()
+
+    # Start the game loop in the background
+    session.update = update_layer
+    session.start()
+    return session
@@ -1,11 +1,84 @@
-import napari
-from napari_tools_menu import register_action
+from typing import TYPE_CHECKING
 
+if TYPE_CHECKING:
+    import napari
 
-@register_action(menu="Games > Sliding Puzzle")
-def sliding_puzzle(viewer: napari.Viewer):
-    game = SlidingPuzzleGame.instance(viewer)
-    game.start()
+
+def sliding_puzzle(viewer: "napari.Viewer"):
+    return start_sliding_puzzle(viewer)
+
+
+def start_sliding_puzzle(viewer: "napari.Viewer", keys: dict = None, name: str = "sliding_puzzle", scheduler=None):
+    """
+    Start a sliding puzzle on the currently selected layer. Keys can be customized, e.g. keys={"up": "i"}.
+    Sessions with the same name in the same viewer replace each other.
+    Returns the GameSession, which can be paused, restarted and stopped.
+    """
+    from ._scheduler import GameSession
+
+    game = SlidingPuzzleGame(viewer)
+
+    def update_layers(data):
+        """
+        This function is called when a new game state has been computed in the background thread.
+        It is responsible for updating the viewer in the main thread
+        """
+        if game.game_layer is not None:
+            game.game_layer.data = data
+
+    # The game loop runs in the background and executes actions if the user hit a key.
+    session = GameSession(game, update_layers, viewer=viewer, name=name, scheduler=scheduler)
+
+    # Key bindings for the game
+    player_keys = {
+        "up": 'w',
+        "left": 'a',
+        "down": 's',
+        "right": 'd',
+        "random": 'r',
+        "home": 'f',
+    }
+    if keys is not None:
+        player_keys.update(keys)
+
+    def player_up_event(viewer):
+        game.inputs.put('move', 'w')
+
+    def player_left_event(viewer):
+        game.inputs.put('move', 'a')
+
+    def player_down_event(viewer):
+        game.inputs.put('move', 's')
+
+    def player_right_event(viewer):
+        game.inputs.put('move', 'd')
+
+    def player_random_next_step(viewer):
+        """
+        Make a random move.
+        """
+        game.inputs.put('random')
+
+    def player_find_home(viewer):
+        """
+        Revert the game state and go back to the start.
+
+        That's an Easter egg.
+
+        Let's see who reads the code or hits the F key by chance.
+        """
+        game.inputs.put('home')
+
+    session.bind_key(player_keys["up"], player_up_event)
+    session.bind_key(player_keys["left"], player_left_event)
+    session.bind_key(player_keys["down"], player_down_event)
+    session.bind_key(player_keys["right"], player_right_event)
+    session.bind_key(player_keys["random"], player_random_next_step)
+    session.bind_key(player_keys["home"], player_find_home)
+
+    # set up the game on the current layer and start the loop
+    session.restart()
+    return session
 
 
 class SlidingPuzzleGame():
@@ -15,106 +88,30 @@ class SlidingPuzzleGame():
     by a black square. The use can then use the WASD keys on the keyboard to move the replace the black tile with
     neighbor tiles.
     """
-    def __init__(self, viewer: napari.Viewer):
+    def __init__(self, viewer: "napari.Viewer"):
         """
-        This function is called only once because we don't want to add multiple key handlers and
-        background threads to the viewer.
+        The game is set up on the viewer's current layer when `reset()` is called.
         """
-        from napari._qt.qthreading import thread_worker
-        import time
+        from ._input import InputQueue
         self.game_layer = None
         self.pos_x = 0
         self.pos_y = 0
         self.height = 0
         self.width = 0
+        self.patch_size = 100
+        self.game_state = 0
+        self.game_chain = []
         self.viewer = viewer
         self.image = None
+        self.frame_delay = 0.05 # seconds
+        self.inputs = InputQueue()
 
-        def update_layers(data):
-            """
-            This function is called when a new game state has been computed in the background thread.
-            It is responsible for updating the viewer in the main thread
-            """
-            if self.game_layer is not None:
-                self.game_layer.data = data
-
-        @thread_worker
-        def loop_run():
-            """
-            This is an endless loop executing actions if the user hit a key.
-            """
-            while True:  # endless loop
-                data = self.game_loop()
-                yield data
-                time.sleep(0.05)
-
-        # Start the loop
-        worker = loop_run()
-        worker.yielded.connect(update_layers)
-        worker.start()
-
-        # Key bindings for the game
-        @viewer.bind_key('w', overwrite=True)
-        def player_up_event(viewer):
-            if self.pos_y > 0:
-                self.game_chain.append('w')
-
-        @viewer.bind_key('a', overwrite=True)
-        def player_left_event(viewer):
-            if self.pos_x > 0:
-                self.game_chain.append('a')
-
-        @viewer.bind_key('s', overwrite=True)
-        def player_down_event(viewer):
-            if self.pos_y < (self.height / self.patch_size) - 1:
-                self.game_chain.append('s')
-
-        @viewer.bind_key('d', overwrite=True)
-        def player_right_event(viewer):
-            if self.pos_x < (self.width / self.patch_size) - 1:
-                self.game_chain.append('d')
-
-        @viewer.bind_key('r', overwrite=True)
-        def player_random_next_step(viewer):
-            """
-            Make a random move.
-            """
-            self.game_chain = self.game_chain + make_random_game(self.pos_x,self.pos_y,self.image,self.patch_size,1)
-
-        @viewer.bind_key('f', overwrite=True)
-        def player_find_home(viewer):
-            """
-            Revert the game state and go back to the start.
-
-            That's an Easter egg.
-
-            Let's see who reads the code or hits the F key by chance.
-            """
-            copy = self.game_chain.copy()
-            copy.reverse()
-            list_replace(copy, 'w', 't')
-            list_replace(copy, 's', 'w')
-            list_replace(copy, 't', 's')
-            list_replace(copy, 'a', 't')
-            list_replace(copy, 'd', 'a')
-            list_replace(copy, 't', 'd')
-            self.game_chain = self.game_chain + copy
-
-    @classmethod
-    def instance(cls, viewer):
-        """
-        This is a singleton implementation.
-        """
-        if not hasattr(cls, "_instance"):
-            cls._instance = SlidingPuzzleGame(viewer)
-        return cls._instance
-
-    def start(self):
+    def reset(self):
         """
         Start the game on the current layer. If no layer is open, load Pixel the cat.
+        Called by the session when the game is (re-)started.
         """
-        from skimage.io import imread, imshow
-        from pathlib import Path
+        from ._assets import data_path, load_image
 
         # game config
         self.patch_size = 100
@@ -127,8 +124,7 @@ class SlidingPuzzleGame():
 
         # if no layer open, load a picture of Pixel
         if len(self.viewer.layers) == 0:
-            data_path = Path(__file__).parent / "data"
-            dataset = imread(data_path / '17157718_1475080609170139_6436185275063838511_o.jpg')
+            dataset = load_image(data_path('17157718_1475080609170139_6436185275063838511_o.jpg'))
             self.viewer.add_image(dataset[100:1000,400:1600].copy())
 
         # initialize image
@@ -153,11 +149,62 @@ class SlidingPuzzleGame():
         self.pos_y = start_y
 
 
-    def game_loop(self):
+    def handle_inputs(self):
+        """
+        Translate pending key hits into moves in the game chain. This runs in the background thread, so that
+        the game chain and position are never modified while a move is executed.
+        If the game was idle, the first new move is executed right away and True is returned.
+        """
+        events = self.inputs.drain()
+        if self.image is None or len(events) == 0:
+            return False
+
+        idle = self.game_state >= len(self.game_chain)
+        for event in events:
+            if event.action == 'move':
+                direction = event.args[0]
+                if direction == 'w' and self.pos_y > 0 or \
+                    direction == 'a' and self.pos_x > 0 or \
+                    direction == 's' and self.pos_y < (self.height / self.patch_size) - 1 or \
+                    direction == 'd' and self.pos_x < (self.width / self.patch_size) - 1:
+                    self.game_chain.append(direction)
+            elif event.action == 'random':
+                self.game_chain = self.game_chain + make_random_game(self.pos_x, self.pos_y, self.image, self.patch_size, 1)
+            elif event.action == 'home':
+                copy = self.game_chain.copy()
+                copy.reverse()
+                list_replace(copy, 'w', 't')
+                list_replace(copy, 's', 'w')
+                list_replace(copy, 't', 's')
+                list_replace(copy, 'a', 't')
+                list_replace(copy, 'd', 'a')
+                list_replace(copy, 't', 'd')
+                self.game_chain = self.game_chain + copy
+
+        if idle and self.game_state < len(self.game_chain):
+            self.make_move()
+            return True
+        return False
+
+    def render(self):
+        return self.image
+
+    def game_step(self):
         """
         This function runs in an endless loop in the background.
         In case the use hit a key, it will update the game state.
         """
+        if not self.handle_inputs():
+            self.make_move()
+        return self.image
+
+    # former name of game_step
+    game_loop = game_step
+
+    def make_move(self):
+        """
+        Execute the next move in the game chain, if there is any.
+        """
         if self.game_state < len(self.game_chain):
             if self.game_state < 0:
                 direction = self.game_chain[-1]
@@ -179,8 +226,6 @@ class SlidingPuzzleGame():
             else:
                 self.game_state += 1
 
-        return self.image
-
 
 def make_random_game(start_x, start_y, image, patch_size, length):
     """
@@ -17,115 +17,189 @@ player2_right_key = 'l'
 # Have fun!
 #   @haesleinhuepf
 
-import time
-import napari
+import re
+from collections import deque
+from typing import TYPE_CHECKING
 import numpy as np
-from napari.qt.threading import thread_worker
-from qtpy.QtWidgets import QLineEdit, QLabel, QWidget, QVBoxLayout
-from ._utils import draw_box
+from ._utils import draw_box, draw_cells, draw_frame, overview_factor, visible_region
+from ._input import InputQueue
+from ._scheduler import GameSession
 from scipy.ndimage import maximum_filter
-from napari_tools_menu import register_action
+
+if TYPE_CHECKING:
+    import napari
+
+# values the snakes are drawn with, 4 is the frame and 10 is food
+player_values = [2, 7, 3, 8, 1, 6, 9, 5]
+
 
 class Game:
+    # frames are uint8 images of the values above, shown with this colormap
+    colormap = 'turbo'
+    contrast_limits = (0, 10)
 
-    def __init__(self):
+    def __init__(self, render_mode="raster", width=640, height=480, maximum_food_available=10, players=2,
+                 seed=None):
         """ Setup the game
+
+        Parameters
+        ----------
+        render_mode: str
+            "raster" for drawing the whole playground into an image at every step or "vector" for returning
+            the positions of snakes and food only, see `sprites()`
+        width, height: int
+            size of the playground in pixels, a multiple of `pixel_size`. Large playgrounds should be shown
+            using a `viewport`.
+        maximum_food_available: int
+            food on the playground, consider increasing it for large playgrounds
+        players: int
+            number of snakes. Any of them can be steered by keys, over the network or by bots using
+            `set_direction()`.
+        seed: int, optional
+            seed of the random food placement, for repeatable games
         """
+        self.render_mode = render_mode
+        self.inputs = InputQueue()
+        self.random = np.random.default_rng(seed)
 
         # playground config
-        self.width = 640
-        self.height = 480
+        self.width = width
+        self.height = height
+        self.players = players
 
         self.pixel_size = 10
         self.food_calories = 5
-        self.maximum_food_available = 10
+        self.maximum_food_available = maximum_food_available
 
         self.frame_delay = 0.2 # seconds
+        self.game_over_delay = 5 # seconds
+
+        # part of the playground to render as (top, left, bottom, right) in pixels, None for all of it
+        self.viewport = None
+        self.maximum_viewport_size = 2048 # cells
+        self.overview_size = 512 # pixels
+
+        self.reset()
+
+    def reset(self):
+        """ Put all players to their start positions, remove all food and set the scores to 0
+        """
+        # number of steps until the game restarts after a game over
+        self.game_over_countdown = 0
+
+        # direction changes which were not applied yet, one is applied per step
+        self.turns = [deque(maxlen=3) for _ in range(self.players)]
 
-        # player 1
-        self.player1_delta_x = 0
-        self.player1_delta_y = self.pixel_size
-        self.player1_score = 0
-        self.player1_positions = [
-            [240, 240]
-        ]
+        # players: the snakes' (x, y) positions are stored in a ring buffer, all heads are at `head_index`
+        # and the snakes' bodies follow in descending indices
+        self.bodies = np.zeros((self.players, 16, 2), dtype=int)
+        self.head_index = 0
+        self.lengths = np.ones(self.players, dtype=int)
+        self.scores = np.zeros(self.players, dtype=int)
+        self.alive = np.ones(self.players, dtype=bool)
+        self.bodies[:, 0], self.directions = self._start_positions()
 
-        # player 2
-        self.player2_delta_x = 0
-        self.player2_delta_y = -self.pixel_size
-        self.player2_score = 0
-        self.player2_positions = [
-            [480, 240]
-        ]
+        # (x, y) positions
+        self.food_positions = np.zeros((0, 2), dtype=int)
 
-        self.food_positions = []
+        # the occupied cells of the playground: -1 is food and players are their number
+        self.grid = None
 
         # others
         self.iteration = 0
 
-        self.playground = np.zeros([self.height, self.width])
-        self.temp = np.zeros([self.height, self.width])
+        # full-size images are only allocated when they are drawn without viewport
+        self.playground = None
+        self.temp = None
 
-        self.result_label = QLabel()
+    def _start_positions(self):
+        """Returns start positions and directions of all players. Two players start facing each other, more
+        players start on a lattice, moving down and up in alternating columns.
+        """
+        if self.players <= 2:
+            positions = [
+                self._grid_position(self.width * 3 / 8, self.height / 2),
+                self._grid_position(self.width * 6 / 8, self.height / 2),
+            ][:self.players]
+            directions = [[self.pixel_size, 0], [-self.pixel_size, 0]][:self.players]
+            return np.asarray(positions, dtype=int).reshape(-1, 2), np.asarray(directions, dtype=int).reshape(-1, 2)
+
+        rows = int(np.ceil(np.sqrt(self.players * self.height / self.width)))
+        columns = int(np.ceil(self.players / rows))
+        row, column = np.divmod(np.arange(self.players), columns)
+        positions = np.stack([
+            ((column + 0.5) * self.width / columns) // self.pixel_size,
+            ((row + 0.5) * self.height / rows) // self.pixel_size,
+        ], axis=-1).astype(int) * self.pixel_size
+        directions = np.zeros((self.players, 2), dtype=int)
+        directions[:, 1] = np.where(column % 2 == 0, self.pixel_size, -self.pixel_size)
+        return positions, directions
+
+    def _grid_position(self, x, y):
+        return [int(x / self.pixel_size) * self.pixel_size, int(y / self.pixel_size) * self.pixel_size]
+
+    def set_direction(self, player, delta_x, delta_y):
+        """Turn a player's snake at the next step, e.g. `set_direction(3, -1, 0)` for up. Can be called from
+        any thread.
+        """
+        self.inputs.put("direction", player, delta_x, delta_y)
 
     def set_player1_direction(self, delta_x, delta_y):
-        self.player1_delta_x = delta_x * self.pixel_size
-        self.player1_delta_y = delta_y * self.pixel_size
+        self.set_direction(1, delta_x, delta_y)
 
     def set_player2_direction(self, delta_x, delta_y):
-        self.player2_delta_x = delta_x * self.pixel_size
-        self.player2_delta_y = delta_y * self.pixel_size
+        self.set_direction(2, delta_x, delta_y)
 
-    def game_step(self):
-        """Forwards the game by one step and computes the new playground
+    def handle_inputs(self):
+        """Queue up all pending direction changes. They become visible with the next step only, hence
+        there is nothing to redraw and this returns False.
+        """
+        for event in self.inputs.drain():
+            player, delta_x, delta_y = event.args
+            if 1 <= player <= self.players:
+                # delta_x moves up and down, the rows of the playground
+                self.turns[player - 1].append((delta_y * self.pixel_size, delta_x * self.pixel_size))
+        return False
+
+    def next_direction(self, turns, delta_x, delta_y):
+        """Take the next direction change from the queue. Changes into the current direction and
+        reversals into the snake's own body are skipped.
+        """
+        while len(turns) > 0:
+            new_delta_x, new_delta_y = turns.popleft()
+            if (new_delta_x, new_delta_y) != (delta_x, delta_y) and \
+                (new_delta_x, new_delta_y) != (-delta_x, -delta_y):
+                return new_delta_x, new_delta_y
+        return delta_x, delta_y
+
+    def positions(self, player):
+        """Returns the (x, y) positions of a player's snake as (n, 2) array, head first
+        """
+        length = self.lengths[player - 1] if self.alive[player - 1] else 0
+        return self.bodies[player - 1, (self.head_index - np.arange(length)) % self.bodies.shape[1]]
+
+    def render(self):
+        """Draws the current state of the game
 
         Returns
         -------
-            an image with the current state of the game
+            an image of the playground, or a dictionary of sprites in "vector" render mode
         """
+        if self.render_mode == "vector":
+            return self.sprites()
+        if self.viewport is not None:
+            return self.render_viewport()
 
-        self.result_label.setText(str(self.player1_score) + " : " + str(self.player2_score))
-
-        # move player 1
-        result = self.move_player(self.player1_positions, self.player1_delta_x, self.player1_delta_y, self.player1_score)
-        if result is None:
-            return self.playground
-        self.player1_positions = result
-
-        # move player 2
-        result = self.move_player(self.player2_positions, self.player2_delta_x, self.player2_delta_y, self.player2_score)
-        if result is None:
-            return self.playground
-        self.player2_positions = result
-
-        # go through food positions and check if a player ate it
-        new_food_positions = []
-        for pos in self.food_positions:
-            if pos == self.player1_positions[0]:
-                self.player1_score = self.player1_score + self.food_calories
-            elif pos == self.player2_positions[0]:
-                self.player2_score = self.player2_score + self.food_calories
-            else:
-                new_food_positions.append(pos)
-        self.food_positions = new_food_positions
-
-        # seed new food from time to time
-        if len(self.food_positions) < self.maximum_food_available:
-            random_x = (int(np.random.random_sample() * self.width / self.pixel_size - 2) + 1) * self.pixel_size
-            random_y = (int(np.random.random_sample() * self.height / self.pixel_size - 2) + 1) * self.pixel_size
-            if [random_x, random_y] not in self.player1_positions and \
-                [random_x, random_y] not in self.player2_positions and \
-                [random_x, random_y] not in self.food_positions:
-                self.food_positions.append([random_x, random_y])
+        if self.temp is None:
+            self.temp = np.zeros([self.height, self.width], dtype=np.uint8)
 
         # draw playground frame
         draw_box(self.temp, 0, 0, 0, self.width, self.height, 1, 4)
         draw_box(self.temp, 1, 1, 0, self.width - 3, self.height - 3, 1, 0)
 
         # draw players and food
-        self.draw_positions(self.player1_positions, 2)
-        self.draw_positions(self.player2_positions, 7)
-        self.draw_positions(self.food_positions, 10)
+        positions, values = self._drawn_positions()
+        draw_cells(self.temp, positions, values)
 
         self.playground = maximum_filter(self.temp, size=self.pixel_size)
 
@@ -134,115 +208,515 @@ class Game:
 
         return image
 
-    def move_player(self, positions, player_delta_x, player_delta_y, player_score):
-        """ Move a player by one step and check if it hit the wall, itself or the other player.
-        The game is over then.
+    def render_viewport(self):
+        """Draws the part of the playground inside the `viewport` with one pixel per cell, and an overview of the
+        whole playground. The effort depends on the size of the viewport and on the number of players and food,
+        not on the size of the playground.
+
+        Returns
+        -------
+            a dictionary with the 'viewport' and 'overview' images and their scale and translation in pixels of
+            the full playground. The viewport is None if it is larger than `maximum_viewport_size` cells.
+        """
+        cell = self.pixel_size
+        # cells 0 and width / pixel_size are walls
+        columns = self.width // cell + 1
+        rows = self.height // cell + 1
+        positions, values = self._drawn_positions()
+
+        view = None
+        origin = (0, 0)
+        region = visible_region(np.asarray(self.viewport) / cell, columns, rows, self.maximum_viewport_size)
+        if region is not None:
+            top, left, bottom, right = region
+            view = np.zeros([bottom - top, right - left], dtype=np.uint8)
+            origin = (top, left)
+            draw_frame(view, -top, -left, rows, columns, 4)
+            draw_cells(view, positions // cell - [left, top], values)
+
+        factor = self.overview_factor()
+        overview = np.zeros([int(np.ceil(rows / factor)), int(np.ceil(columns / factor))], dtype=np.uint8)
+        draw_frame(overview, 0, 0, overview.shape[0], overview.shape[1], 4)
+        draw_cells(overview, positions // (cell * factor), values)
+
+        # cell k is drawn around pixel k * pixel_size + 0.5 in the full playground, see `_sprite_centers()`
+        return {
+            'viewport': view,
+            'viewport_scale': (cell, cell),
+            'viewport_translate': tuple(o * cell + 0.5 for o in origin),
+            'overview': overview,
+            'overview_scale': (cell * factor, cell * factor),
+            'overview_translate': ((factor - 1) * cell / 2 + 0.5,) * 2,
+        }
+
+    def overview_factor(self):
+        """Returns how many cells are summarized in one pixel of the overview
+        """
+        return overview_factor(self.width // self.pixel_size + 1, self.height // self.pixel_size + 1,
+                               self.overview_size)
+
+    def _bodies(self):
+        """Returns the (x, y) positions of all snakes as (n, 2) array and the players they belong to
+        """
+        capacity = self.bodies.shape[1]
+        age = (self.head_index - np.arange(capacity)) % capacity
+        occupied = (age[np.newaxis] < self.lengths[:, np.newaxis]) & self.alive[:, np.newaxis]
+        return self.bodies[occupied], np.nonzero(occupied)[0] + 1
+
+    def player_value(self, player):
+        """Returns the value a player is drawn with
+        """
+        return np.take(player_values, np.asarray(player) - 1, mode='wrap')
+
+    def _drawn_positions(self):
+        """Returns an (n, 2) array of (x, y) positions of snakes and food and the values they are drawn with
         """
-        player_position_x = positions[0][0] + player_delta_y
-        player_position_y = positions[0][1] + player_delta_x
+        positions, players = self._bodies()
+        return np.concatenate([positions, self.food_positions]), \
+            np.concatenate([self.player_value(players), np.full(len(self.food_positions), 10)])
 
-        if self.is_game_over(player_position_x, player_position_y):
+    def state(self):
+        """Returns the state of the game which changes from step to step, e.g. for sending it over the network.
+        Every player has its own entries, so that only the players which changed need to be sent.
+        """
+        state = {
+            'food_positions': self.food_positions.tolist(),
+            'game_over_countdown': self.game_over_countdown,
+        }
+        for player in range(1, self.players + 1):
+            state['player' + str(player) + '_positions'] = self.positions(player).tolist()
+            state['player' + str(player) + '_score'] = int(self.scores[player - 1])
+        return state
+
+    def load_state(self, state):
+        """Overwrite the game state with a state as returned by `state()`. Unknown entries are ignored. If the
+        state has more players than this game, e.g. when joining a game hosted for more players, players are added.
+        """
+        player_numbers = [int(entry.group(1)) for entry in map(self._player_entry, state.keys()) if entry is not None]
+        if len(player_numbers) > 0 and max(player_numbers) > self.players:
+            self._add_players(max(player_numbers))
+
+        bodies = {}
+        for key, value in state.items():
+            player_entry = self._player_entry(key)
+            if player_entry is not None and player_entry.group(2) == 'positions':
+                bodies[int(player_entry.group(1))] = value
+            elif player_entry is not None:
+                self.scores[int(player_entry.group(1)) - 1] = value
+            elif key == 'food_positions':
+                self.food_positions = np.asarray(value, dtype=int).reshape(-1, 2)
+            elif key == 'game_over_countdown':
+                self.game_over_countdown = int(value)
+
+        if len(bodies) > 0:
+            # players missing in the state keep their positions
+            self._ensure_capacity(max(len(body) for body in bodies.values()))
+            capacity = self.bodies.shape[1]
+            for player, body in bodies.items():
+                # head at `head_index`, the body in descending indices
+                self.lengths[player - 1] = len(body)
+                self.alive[player - 1] = len(body) > 0
+                if len(body) > 0:
+                    indices = (self.head_index - np.arange(len(body))) % capacity
+                    self.bodies[player - 1, indices] = body
+        self.grid = None
+
+    @staticmethod
+    def _player_entry(key):
+        # matches state entries like 'player3_positions', with the player number and the kind of entry as groups
+        return re.fullmatch(r'player([1-9]\d*)_(positions|score)', key)
+
+    def _add_players(self, players):
+        """Grow the per-player arrays to a larger number of players. The new players are not alive until their
+        positions are loaded.
+        """
+        added = players - self.players
+        self.turns.extend(deque(maxlen=3) for _ in range(added))
+        self.bodies = np.concatenate([self.bodies, np.zeros((added,) + self.bodies.shape[1:], dtype=int)])
+        self.lengths = np.concatenate([self.lengths, np.zeros(added, dtype=int)])
+        self.scores = np.concatenate([self.scores, np.zeros(added, dtype=int)])
+        self.alive = np.concatenate([self.alive, np.zeros(added, dtype=bool)])
+        self.directions = np.concatenate([self.directions, np.zeros((added, 2), dtype=int)])
+        self.players = players
+
+    def remote_input(self, player, action, args):
+        """Queue input received over the network, if it's valid. Returns True if the input was accepted.
+        """
+        # types first, args can be anything sent by a client
+        if action != "direction" or not 1 <= player <= self.players or len(args) != 2 or \
+            not all(isinstance(arg, int) and not isinstance(arg, bool) for arg in args) or \
+            sorted([abs(arg) for arg in args]) != [0, 1]:
+            return False
+        self.inputs.put("direction", player, args[0], args[1])
+        return True
+
+    def background(self, per_cell=False):
+        """Returns the empty playground with its frame, which doesn't change during the game. With `per_cell`, it is
+        a single pixel of the empty playground without frame, which must be shown scaled to `height` and `width`,
+        and the frame is drawn as the outline of the rectangle `wall()`. This saves memory for large playgrounds.
+        """
+        if per_cell:
+            return np.zeros([1, 1], dtype=np.uint8)
+        frame = np.zeros([self.height, self.width], dtype=np.uint8)
+        draw_box(frame, 0, 0, 0, self.width, self.height, 1, 4)
+        draw_box(frame, 1, 1, 0, self.width - 3, self.height - 3, 1, 0)
+        return maximum_filter(frame, size=self.pixel_size)
+
+    def wall(self):
+        """Returns the corners of the frame around the playground as (4, 2) array in (row, column) coordinates. The
+        frame is an outline of `pixel_size` width, centered on the outermost cells, drawn with the value 4.
+        """
+        rows, columns = self.height // self.pixel_size, self.width // self.pixel_size
+        corners = np.asarray([[0, 0], [0, columns], [rows, columns], [rows, 0]], dtype=float)
+        return corners * self.pixel_size + (self.pixel_size - 1) / 2
+
+    def sprites(self):
+        """Returns the centers of the squares which are drawn for players and food as (n, 2) arrays of
+        (row, column) coordinates in a dictionary, together with the values the players are drawn with
+        """
+        positions, players = self._bodies()
+        return {
+            'players': self._sprite_centers(positions),
+            'player_values': self.player_value(players),
+            'food': self._sprite_centers(self.food_positions),
+        }
+
+    def _sprite_centers(self, positions):
+        # positions are drawn as single pixels at (p[1], p[0]) which maximum_filter() grows to squares
+        # covering p - pixel_size / 2 + 1 ... p + pixel_size / 2
+        if len(positions) == 0:
+            return np.zeros((0, 2))
+        return np.asarray(positions, dtype=float)[:, ::-1] + 0.5
+
+    def status(self):
+        """Returns the current score as text
+        """
+        if self.players <= 4:
+            text = " : ".join(str(score) for score in self.scores)
+        else:
+            leader = int(np.argmax(self.scores))
+            text = "Player " + str(leader + 1) + " leads with " + str(self.scores[leader]) + ", " + \
+                str(np.count_nonzero(self.alive)) + " of " + str(self.players) + " alive"
+        if self.game_over_countdown > 0:
+            text = "Game over! " + text
+        return text
+
+    def game_step(self):
+        """Forwards the game by one step and computes the new playground. All snakes move at once: heads
+        hitting a wall, a snake or each other die, and food is eaten by the head reaching it.
+
+        Returns
+        -------
+            an image with the current state of the game
+        """
+
+        # after a game over, the playground stays for a while before the game restarts
+        if self.game_over_countdown > 0:
+            self.inputs.drain()
+            self.game_over_countdown -= 1
+            if self.game_over_countdown == 0:
+                self.reset()
+            return self.render()
+
+        # apply one direction change per player
+        self.handle_inputs()
+        for player, turns in enumerate(self.turns):
+            if len(turns) > 0:
+                self.directions[player] = self.next_direction(turns, *self.directions[player])
+
+        grid = self._grid()
+        cell = self.pixel_size
+        movers = np.nonzero(self.alive)[0]
+
+        # snakes which don't grow leave the cell of their tail
+        self._ensure_capacity(self.lengths.max() + 1)
+        capacity = self.bodies.shape[1]
+        shrinking = movers[self.lengths[movers] >= self.scores[movers] + 4]
+        tails = self.bodies[shrinking, (self.head_index - self.lengths[shrinking] + 1) % capacity] // cell
+        grid.clear(tails)
+
+        # move all heads and find the ones hitting a wall, a snake or another head
+        heads = self.bodies[movers, self.head_index] + self.directions[movers]
+        inside = (heads[:, 0] > 0) & (heads[:, 0] < self.width) & (heads[:, 1] > 0) & (heads[:, 1] < self.height)
+        cells = np.where(inside[:, np.newaxis], heads // cell, 0)
+        hit = grid.get(cells)
+        _, index, counts = np.unique(grid.cell_ids(cells), return_inverse=True, return_counts=True)
+        dying = ~inside | (hit > 0) | (counts[index] > 1)
+
+        # remove dead snakes
+        for player in movers[dying]:
+            grid.clear(self.positions(player + 1) // cell)
+            self.alive[player] = False
+
+        # move surviving snakes ahead and let them eat
+        survivors = movers[~dying]
+        heads, cells, eating = heads[~dying], cells[~dying], hit[~dying] < 0
+        self.head_index = (self.head_index + 1) % capacity
+        self.bodies[survivors, self.head_index] = heads
+        self.lengths[np.setdiff1d(survivors, shrinking, assume_unique=True)] += 1
+        self.scores[survivors[eating]] += self.food_calories
+        grid.set(cells, survivors + 1)
+
+        if eating.any():
+            eaten = grid.cell_ids(cells[eating])
+            self.food_positions = self.food_positions[~np.isin(grid.cell_ids(self.food_positions // cell), eaten)]
+
+        if np.count_nonzero(self.alive) < min(2, self.players):
             print("Game over!")
-            time.sleep(5)
-            self.__init__()
-            return None
-
-        # move snake ahead
-        new_positions = [
-            [player_position_x, player_position_y]
-        ]
-        for i, pos in enumerate(positions):
-            if i > player_score + 2:
-                break
-            new_positions.append(pos)
-
-
-        return new_positions
-
-    def is_game_over(self, player_position_x, player_position_y):
-        return [player_position_x, player_position_y] in self.player1_positions or \
-               [player_position_x, player_position_y] in self.player2_positions or \
-               player_position_x <= 0 or \
-               player_position_x >= self.width or \
-               player_position_y <= 0 or \
-               player_position_y >= self.height
-
-    def draw_positions(self, new_positions, value):
-        """bring position lists in the right format and draw the list of coordinates in a given color on the playground.
-        """
-        for p in new_positions:
-            try:
-                self.temp[(p[1], p[0])] = value
-            except IndexError:
-                pass
-
-@register_action(menu="Games > Snake")
-def snake(viewer : napari.Viewer):
-    viewer.title = "natari"
+            self.game_over_countdown = max(1, int(self.game_over_delay / self.frame_delay))
+            return self.render()
 
-    game = Game()
+        # seed new food from time to time
+        self._seed_food(grid, min(self.maximum_food_available - len(self.food_positions), max(1, self.players // 2)))
 
-    # Key bindings for user control
-    @viewer.bind_key(player1_up_key, overwrite=True)
-    def player1_up_event(viewer):
-        game.set_player1_direction(-1, 0)
+        return self.render()
 
-    @viewer.bind_key(player1_down_key, overwrite=True)
-    def player1_down_event(viewer):
-        game.set_player1_direction(1, 0)
+    def _seed_food(self, grid, count):
+        """Put food on up to `count` random empty cells
+        """
+        if count <= 0:
+            return
+        cells = np.stack([
+            self.random.integers(1, self.width // self.pixel_size, size=count),
+            self.random.integers(1, self.height // self.pixel_size, size=count),
+        ], axis=-1)
+        cells = np.unique(cells[grid.get(cells) == 0], axis=0)
+        grid.set(cells, -1)
+        self.food_positions = np.concatenate([self.food_positions, cells * self.pixel_size])
+
+    def _grid(self):
+        """Returns the occupied cells of the playground, with players and food, see `SparseGrid`. It is built
+        once and then updated by `game_step()`.
+        """
+        if self.grid is None:
+            self.grid = SparseGrid(self.height // self.pixel_size + 1, self.width // self.pixel_size + 1)
+            positions, players = self._bodies()
+            self.grid.set(self.food_positions // self.pixel_size, -1)
+            self.grid.set(positions // self.pixel_size, players)
+        return self.grid
+
+    def _ensure_capacity(self, length):
+        """Grow the ring buffer of the snakes' positions so that it can store snakes of a given length
+        """
+        capacity = self.bodies.shape[1]
+        if length <= capacity:
+            return
+        new_capacity = max(length, capacity * 2)
+        # oldest positions first, the heads at the end
+        ordered = self.bodies[:, (self.head_index + 1 + np.arange(capacity)) % capacity]
+        self.bodies = np.zeros((self.players, new_capacity, 2), dtype=int)
+        self.bodies[:, :capacity] = ordered
+        self.head_index = capacity - 1
+
+
+class SparseGrid:
+    """The non-empty cells of a grid of `rows` x `columns` cells, stored as sorted cell ids with their values. Memory
+    and the time for updates depend on the number of occupied cells, not on the size of the grid. Cells are
+    addressed by (n, 2) integer (x, y) arrays, empty cells have the value 0.
+    """
+    def __init__(self, rows, columns):
+        self.shape = (rows, columns)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.values = np.zeros(0, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def cell_ids(self, cells):
+        cells = np.asarray(cells, dtype=np.int64).reshape(-1, 2)
+        return cells[:, 1] * self.shape[1] + cells[:, 0]
+
+    def _find(self, ids):
+        # positions of the ids in `self.ids` and whether they are there
+        index = np.minimum(np.searchsorted(self.ids, ids), max(len(self.ids) - 1, 0))
+        found = self.ids[index] == ids if len(self.ids) > 0 else np.zeros(len(ids), dtype=bool)
+        return index, found
+
+    def get(self, cells):
+        """Returns the values of the cells
+        """
+        index, found = self._find(self.cell_ids(cells))
+        return np.where(found, self.values[index] if len(self.ids) > 0 else 0, 0)
 
-    @viewer.bind_key(player1_left_key, overwrite=True)
-    def player1_left_event(viewer):
-        game.set_player1_direction(0, -1)
+    def set(self, cells, values):
+        """Set cells to a value or to n values, 0 empties them. If cells repeat, the last one wins.
+        """
+        ids = self.cell_ids(cells)
+        if len(ids) == 0:
+            return
+        values = np.resize(np.asarray(values, dtype=np.int32), ids.shape)
+        self.clear_ids(ids)
+
+        # sorted by cell id, the last value of repeated cells
+        order = np.argsort(ids, kind="stable")
+        ids, values = ids[order], values[order]
+        keep = np.append(ids[1:] != ids[:-1], True) & (values != 0)
+        ids, values = ids[keep], values[keep]
+
+        index = np.searchsorted(self.ids, ids)
+        self.ids = np.insert(self.ids, index, ids)
+        self.values = np.insert(self.values, index, values)
+
+    def clear(self, cells):
+        """Empty the cells
+        """
+        self.clear_ids(self.cell_ids(cells))
 
-    @viewer.bind_key(player1_right_key, overwrite=True)
-    def player1_right_event(viewer):
-        game.set_player1_direction(0, 1)
+    def clear_ids(self, ids):
+        index, found = self._find(ids)
+        if found.any():
+            self.ids = np.delete(self.ids, index[found])
+            self.values = np.delete(self.values, index[found])
 
-    # Key bindings for user control
-    @viewer.bind_key(player2_up_key, overwrite=True)
-    def player2_up_event(viewer):
-        game.set_player2_direction(-1, 0)
+    def window(self, top, left, bottom, right):
+        """Returns the cells in rows `top` to `bottom` and columns `left` to `right`, cut to the grid, as dense
+        array
+        """
+        top, left = max(top, 0), max(left, 0)
+        bottom, right = min(bottom, self.shape[0]), min(right, self.shape[1])
+        window = np.zeros([max(bottom - top, 0), max(right - left, 0)], dtype=np.int32)
+        starts = np.arange(top, bottom, dtype=np.int64) * self.shape[1] + left
+        first = np.searchsorted(self.ids, starts)
+        last = np.searchsorted(self.ids, starts + (right - left))
+        for row, (start, begin, end) in enumerate(zip(starts, first, last)):
+            window[row, self.ids[begin:end] - start] = self.values[begin:end]
+        return window
+
+
+def snake(viewer : "napari.Viewer"):
+    return start_snake(viewer)
+
+
+def start_snake(viewer : "napari.Viewer", keys : dict = None, name : str = "snake", scheduler=None,
+                render_mode : str = "raster", game : "Game" = None, width : int = 640, height : int = 480,
+                streaming : bool = None, players : int = 2, bots : int = 0):
+    """Start a snake session in a viewer.
+
+    Parameters
+    ----------
+    viewer: napari.Viewer
+    keys: dict, optional
+        keys for the players, e.g. {"player1_up": "w"}. Defaults to the keys defined at the top of this module.
+    name: str, optional
+        sessions with the same name in the same viewer replace each other
+    scheduler: Scheduler, optional
+        background thread to run the game in, defaults to the one shared by all games
+    render_mode: str, optional
+        "raster" sends an image of the playground to the viewer at every step, "vector" uploads the playground
+        once and only updates the coordinates of snakes and food in Points layers
+    game: Game, optional
+        an already set up game, e.g. a `natari._network.RemoteGame` for joining a game hosted elsewhere.
+        Its render mode must match `render_mode`.
+    width, height: int, optional
+        size of the playground in pixels
+    streaming: bool, optional
+        only render the part of the playground visible in the viewer, plus a low resolution overview. By default,
+        playgrounds larger than 2048 pixels are streamed.
+    players: int, optional
+        number of snakes. Players 1 and 2 are steered by keys, others can be steered with `game.set_direction()`
+        or over the network.
+    bots: int, optional
+        number of players steered by the computer, the last ones. E.g. `bots=1` for playing alone against the
+        computer.
+
+    Returns
+    -------
+        the GameSession, which can be paused, restarted and stopped
+    """
+    from qtpy.QtWidgets import QLabel, QWidget, QVBoxLayout
+    from napari.utils.colormaps import ensure_colormap
 
-    @viewer.bind_key(player2_down_key, overwrite=True)
-    def player2_down_event(viewer):
-        game.set_player2_direction(1, 0)
+    viewer.title = "natari"
 
-    @viewer.bind_key(player2_left_key, overwrite=True)
-    def player2_left_event(viewer):
-        game.set_player2_direction(0, -1)
+    if game is None:
+        game = Game(render_mode=render_mode, width=width, height=height,
+                    maximum_food_available=max(10, width * height // 30720, players * 5), players=players)
+    if streaming is None:
+        streaming = max(game.width, game.height) > 2048
+    session = GameSession(game, viewer=viewer, name=name, scheduler=scheduler)
 
-    @viewer.bind_key(player2_right_key, overwrite=True)
-    def player2_right_event(viewer):
-        game.set_player2_direction(0, 1)
+    # Key bindings for user control
+    player_keys = {
+        "player1_up": player1_up_key,
+        "player1_down": player1_down_key,
+        "player1_left": player1_left_key,
+        "player1_right": player1_right_key,
+        "player2_up": player2_up_key,
+        "player2_down": player2_down_key,
+        "player2_left": player2_left_key,
+        "player2_right": player2_right_key,
+    }
+    if keys is not None:
+        player_keys.update(keys)
+
+    directions = {"up": (-1, 0), "down": (1, 0), "left": (0, -1), "right": (0, 1)}
+    for action, key in player_keys.items():
+        player, direction = action.split("_")
+        player = int(player[len("player"):])
+        if player > game.players - bots:
+            continue
+        delta_x, delta_y = directions[direction]
+        session.bind_key(key, lambda viewer, player=player, delta_x=delta_x, delta_y=delta_y:
+                         game.set_direction(player, delta_x, delta_y))
+
+    from ._bots import SnakeBot
+    for player in range(game.players - bots + 1, game.players + 1):
+        session.add_bot(SnakeBot(game, player))
 
     # Graphical user interface
     widget = QWidget()
     layout = QVBoxLayout()
     widget.setLayout(layout)
 
-    layout.addWidget(game.result_label)
-    viewer.window.add_dock_widget(widget, area="bottom")
-    viewer.window.add_dock_widget(widget, area="bottom")
-    game.result_label.setText(str("0"))
+    result_label = QLabel()
+    layout.addWidget(result_label)
+    session.add_dock_widget(widget, area="bottom")
+    result_label.setText(str("0"))
 
     # Multi-threaded interaction
     # inspired by https://napari.org/docs/dev/events/threading.html
+    def add_result(data, name='result', **kwargs):
+        return viewer.add_image(data, name=name, contrast_limits=game.contrast_limits, colormap=game.colormap,
+                                **kwargs)
+
+    # in vector mode, sprites get the color they have in the raster image
+    colormap = ensure_colormap(game.colormap)
+
+    def add_sprites(data, name, value=10):
+        color = colormap.map([value / game.contrast_limits[1]])[0]
+        layer = viewer.add_points(data, name=name, symbol='square', size=game.pixel_size, edge_width=0,
+                                  face_color=color)
+        # points added later get the same color
+        layer.current_face_color = color
+        return layer
+
     def update_layer(new_image):
-        try:
-            viewer.layers['result'].data = new_image
-        except KeyError:
-            viewer.add_image(
-                new_image, name='result', contrast_limits=(0, 10), colormap='turbo'
-            )
-
-    @thread_worker
-    def yield_random_images_forever():
-        while True:  # infinite loop!
-            yield game.game_step()
-            time.sleep(game.frame_delay)
-
-    # Start the game loop
-    worker = yield_random_images_forever()
-    worker.yielded.connect(update_layer)
-    worker.start()
+        result_label.setText(game.status())
+        if render_mode == "vector":
+            session.show('players', new_image['players'], lambda data: add_sprites(data, 'players'))
+            # every player has its own color
+            session.layers['players'].face_color = colormap.map(new_image['player_values'] / game.contrast_limits[1])
+            session.show('food', new_image['food'], lambda data: add_sprites(data, 'food'))
+        elif streaming:
+            session.show_streamed(new_image, add_result)
+        else:
+            session.show('result', new_image, add_result)
+
+    if render_mode == "vector" and streaming:
+        session.show('result', game.background(per_cell=True), lambda data: add_result(
+            data, scale=(game.height, game.width), translate=((game.height - 1) / 2, (game.width - 1) / 2)))
+        session.show('wall', game.wall(), lambda data: viewer.add_shapes(
+            [data], shape_type='rectangle', name='wall', face_color='transparent', edge_width=game.pixel_size,
+            edge_color=colormap.map([4 / game.contrast_limits[1]])[0]))
+    elif render_mode == "vector":
+        session.show('result', game.background(), add_result)
+    if streaming:
+        viewer.camera.center = (game.height / 2, game.width / 2)
+        viewer.camera.zoom = 1
+    if streaming and render_mode != "vector":
+        session.follow_camera()
+
+    # Start the game loop in the background
+    session.update = update_layer
+    session.start()
+    return session